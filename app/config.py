@@ -3,14 +3,21 @@ Módulo de configuración para cargar variables de entorno y validar settings.
 """
 import os
 from dataclasses import dataclass
-from typing import Optional
-from dotenv import load_dotenv
+from functools import lru_cache
+from typing import Dict, Optional
+from app.services.fast_dotenv import fast_load
 
-# Cargar variables de entorno desde archivo .env
-load_dotenv()
+# Cargar variables de entorno desde archivo .env (en la raíz del proyecto)
+# En despliegues donde las variables ya vienen del entorno no existe el archivo
+_DOTENV_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".env")
+if os.path.exists(_DOTENV_PATH):
+    fast_load(_DOTENV_PATH)
 
+# Cache de variables de entorno ya leídas (se llena bajo demanda)
+_ENV_CACHE: Dict[str, Optional[str]] = {}
 
-@dataclass
+
+@dataclass(slots=True, frozen=True)
 class AzureSearchConfig:
     """Configuración para Azure AI Search."""
     endpoint: str
@@ -18,24 +25,26 @@ class AzureSearchConfig:
     index_name: str
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class AzureOpenAIConfig:
     """Configuración para Azure OpenAI."""
     endpoint: str
     api_key: str
     deployment_name: str
+    embedding_deployment: Optional[str] = None
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class AzureSpeechConfig:
     """Configuración para Azure Speech Services."""
     api_key: str
     region: str
     language: str = "es-ES"
     voice_name: Optional[str] = None
+    tts_cache_dir: Optional[str] = None
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class AppConfig:
     """Configuración completa de la aplicación."""
     azure_search: AzureSearchConfig
@@ -58,7 +67,9 @@ def get_env_var(var_name: str, required: bool = True) -> str:
     Raises:
         ValueError: Si la variable es requerida y no existe.
     """
-    value = os.getenv(var_name)
+    if var_name not in _ENV_CACHE:
+        _ENV_CACHE[var_name] = os.getenv(var_name)
+    value = _ENV_CACHE[var_name]
     if required and not value:
         raise ValueError(
             f"Variable de entorno requerida '{var_name}' no encontrada. "
@@ -67,10 +78,14 @@ def get_env_var(var_name: str, required: bool = True) -> str:
     return value
 
 
+@lru_cache(maxsize=1)
 def load_config() -> AppConfig:
     """
     Carga y valida la configuración desde variables de entorno.
     
+    El resultado se cachea; usa ``load_config.cache_clear()`` (y vacía
+    ``_ENV_CACHE``) para forzar una nueva lectura, por ejemplo en tests.
+    
     Returns:
         AppConfig con toda la configuración validada.
     
@@ -86,6 +101,7 @@ def load_config() -> AppConfig:
     openai_endpoint = get_env_var("AZURE_OPENAI_ENDPOINT")
     openai_api_key = get_env_var("AZURE_OPENAI_API_KEY")
     openai_deployment = get_env_var("AZURE_OPENAI_DEPLOYMENT")
+    openai_embedding_deployment = get_env_var("AZURE_OPENAI_EMBEDDING_DEPLOYMENT", required=False)
     
     # Streamlit (opcional)
     streamlit_port_str = get_env_var("STREAMLIT_SERVER_PORT", required=False)
@@ -96,6 +112,7 @@ def load_config() -> AppConfig:
     speech_region = get_env_var("AZURE_SPEECH_REGION", required=False)
     speech_language = get_env_var("AZURE_SPEECH_LANGUAGE", required=False) or "es-ES"
     speech_voice = get_env_var("AZURE_SPEECH_VOICE", required=False)
+    speech_tts_cache_dir = get_env_var("AZURE_SPEECH_TTS_CACHE_DIR", required=False)
     
     azure_speech = None
     if speech_api_key and speech_region:
@@ -103,7 +120,8 @@ def load_config() -> AppConfig:
             api_key=speech_api_key,
             region=speech_region,
             language=speech_language,
-            voice_name=speech_voice
+            voice_name=speech_voice,
+            tts_cache_dir=speech_tts_cache_dir
         )
     
     return AppConfig(
@@ -115,7 +133,8 @@ def load_config() -> AppConfig:
         azure_openai=AzureOpenAIConfig(
             endpoint=openai_endpoint,
             api_key=openai_api_key,
-            deployment_name=openai_deployment
+            deployment_name=openai_deployment,
+            embedding_deployment=openai_embedding_deployment
         ),
         azure_speech=azure_speech,
         streamlit_port=streamlit_port
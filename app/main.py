@@ -2,7 +2,6 @@
 Aplicación principal de Streamlit para el chat RAG con manuales biomédicos.
 """
 import sys
-import os
 from pathlib import Path
 
 # Agregar el directorio raíz del proyecto al PYTHONPATH
@@ -10,11 +9,23 @@ project_root = Path(__file__).parent.parent
 if str(project_root) not in sys.path:
     sys.path.insert(0, str(project_root))
 
-import streamlit as st
 import tempfile
+import time
+import streamlit as st
 from app.config import load_config
 from app.services.rag_pipeline import RAGPipeline
 from app.services.azure_speech_client import AzureSpeechClient
+from app.services.shared_resources import get_background_loop, get_http_clients
+
+# Frecuencia de refresco de la respuesta en streaming (segundos / caracteres pendientes)
+STREAM_FLUSH_INTERVAL = 0.05
+STREAM_FLUSH_CHARS = 64
+
+# Cache en disco de audios TTS: directorio por defecto (si no se configura
+# AZURE_SPEECH_TTS_CACHE_DIR) y límites
+TTS_CACHE_DEFAULT_DIR = Path(tempfile.gettempdir()) / "field-cognitive-assistant-tts"
+TTS_CACHE_TTL_SECONDS = 7 * 24 * 3600      # Una semana
+TTS_CACHE_MAX_BYTES = 256 * 1024 * 1024    # 256 MB
 
 # Configurar página
 st.set_page_config(
@@ -23,9 +34,14 @@ st.set_page_config(
     layout="wide"
 )
 
-# Inicializar configuración
+# Inicializar configuración (una sola vez por proceso, usando cache)
+@st.cache_resource
+def get_config():
+    """Carga y cachea la configuración de la aplicación."""
+    return load_config()
+
 try:
-    config = load_config()
+    config = get_config()
 except ValueError as e:
     st.error(f"Error de configuración: {str(e)}")
     st.stop()
@@ -36,23 +52,51 @@ except ValueError as e:
 @st.cache_resource
 def get_rag_pipeline():
     """Inicializa y cachea el pipeline RAG."""
-    return RAGPipeline(
+    # Pools HTTP y loop en segundo plano del proceso (sobreviven a "Clear cache")
+    http_client, async_http_client = get_http_clients()
+    loop = get_background_loop()
+    
+    pipeline = RAGPipeline(
         search_config=config.azure_search,
-        openai_config=config.azure_openai
+        openai_config=config.azure_openai,
+        http_client=http_client,
+        async_http_client=async_http_client,
+        loop=loop
     )
+    
+    # Abrir las conexiones en segundo plano mientras se dibuja la interfaz
+    pipeline.warmup()
+    return pipeline
 
 rag_pipeline = get_rag_pipeline()
 
+# Cache de búsquedas: la misma pregunta con el mismo top_k no vuelve a consultar Azure AI Search
+@st.cache_data(ttl=300, max_entries=256, show_spinner=False)
+def cached_search(query: str, top_k: int):
+    """Busca en Azure AI Search y cachea los resultados durante 5 minutos."""
+    return rag_pipeline.search_client.search_documents_text_only(query=query, top_k=top_k)
+
 # Verificar que el método de streaming existe
 if not hasattr(rag_pipeline, 'rag_answer_stream'):
     st.error("⚠️ El método rag_answer_stream no está disponible. Por favor, reinicia Streamlit (Ctrl+C y vuelve a ejecutar).")
     st.stop()
 
-# Inicializar cliente de Azure Speech si está configurado
+# Inicializar cliente de Azure Speech si está configurado (una sola vez, usando cache,
+# para conservar los sintetizadores persistentes y la cache de audios entre reruns)
+@st.cache_resource
+def get_speech_client():
+    """Inicializa y cachea el cliente de Azure Speech Services."""
+    return AzureSpeechClient(
+        config.azure_speech,
+        cache_dir=config.azure_speech.tts_cache_dir or TTS_CACHE_DEFAULT_DIR,
+        ttl_seconds=TTS_CACHE_TTL_SECONDS,
+        disk_cache_max_bytes=TTS_CACHE_MAX_BYTES
+    )
+
 speech_client = None
 if config.azure_speech:
     try:
-        speech_client = AzureSpeechClient(config.azure_speech)
+        speech_client = get_speech_client()
     except Exception as e:
         st.warning(f"⚠️ No se pudo inicializar Azure Speech Services: {str(e)}. La funcionalidad de voz estará deshabilitada.")
 
@@ -122,26 +166,33 @@ with st.sidebar:
 # Cuerpo principal: historial de chat
 st.subheader("💬 Conversación")
 
+def format_sources(sources: list) -> list:
+    """Precalcula el texto de cada fuente (se guarda en el historial para no reformatearlo en cada rerun)."""
+    source_lines = []
+    for i, source in enumerate(sources, 1):
+        source_text = f"{i}. {source.get('source', 'Unknown')}"
+        score = source.get("score", 0.0)
+        if score > 0:
+            source_text += f" - Relevancia: {score:.2f}"
+        source_lines.append(source_text)
+    return source_lines
+
+def render_sources(source_lines: list):
+    """Muestra el bloque de fuentes utilizadas."""
+    if source_lines:
+        st.markdown("---")
+        st.markdown("**📚 Fuentes utilizadas:**")
+        for source_text in source_lines:
+            st.caption(source_text)
+
 # Mostrar historial de mensajes
 for message in st.session_state.messages:
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
         
         # Mostrar fuentes si existen (solo para mensajes del asistente)
-        if message["role"] == "assistant" and "sources" in message:
-            sources = message["sources"]
-            if sources:
-                st.markdown("---")
-                st.markdown("**📚 Fuentes utilizadas:**")
-                for i, source in enumerate(sources, 1):
-                    source_name = source.get("source", "Unknown")
-                    score = source.get("score", 0.0)
-                    
-                    source_text = f"{i}. {source_name}"
-                    if score > 0:
-                        source_text += f" - Relevancia: {score:.2f}"
-                    
-                    st.caption(source_text)
+        if message["role"] == "assistant":
+            render_sources(message.get("sources_rendered"))
 
 # Función para procesar preguntas (común para texto y voz)
 def process_question(prompt: str, is_from_voice: bool = False):
@@ -161,59 +212,55 @@ def process_question(prompt: str, is_from_voice: bool = False):
         try:
             # Mostrar spinner mientras busca
             with st.spinner("Buscando en los manuales..."):
+                search_results = cached_search(prompt, top_k)
+                
                 # Crear generador para streaming
                 stream_generator = rag_pipeline.rag_answer_stream(
                     user_question=prompt,
                     top_k=top_k,
-                    temperature=temperature
+                    temperature=temperature,
+                    search_results=search_results
                 )
             
             # Mostrar respuesta en tiempo real usando streaming
             answer_placeholder = st.empty()
-            full_answer = ""
+            parts: list[str] = []
+            
+            # Agrupar actualizaciones del placeholder para no reenviar todo el texto por cada token
+            pending_chars = 0
+            last_flush = time.monotonic()
+            while True:
+                try:
+                    chunk = next(stream_generator)
+                except StopIteration as stop:
+                    # El generador devuelve las fuentes al terminar
+                    stream_result = stop.value or {}
+                    break
+                parts.append(chunk)
+                pending_chars += len(chunk)
+                now = time.monotonic()
+                if now - last_flush > STREAM_FLUSH_INTERVAL or pending_chars >= STREAM_FLUSH_CHARS:
+                    answer_placeholder.markdown("".join(parts) + "▌")
+                    pending_chars = 0
+                    last_flush = now
             
-            for chunk in stream_generator:
-                full_answer += chunk
-                answer_placeholder.markdown(full_answer)
+            # Render final sin el cursor
+            full_answer = "".join(parts)
+            answer_placeholder.markdown(full_answer)
             
-            # Obtener las fuentes después del streaming
-            try:
-                search_results = rag_pipeline.search_client.search_documents_text_only(
-                    query=prompt,
-                    top_k=top_k
-                )
-                sources = []
-                for doc in search_results:
-                    source_info = {
-                        "source": doc.get("source", "Unknown"),
-                        "score": doc.get("score", 0.0)
-                    }
-                    if "path" in doc:
-                        source_info["path"] = doc["path"]
-                    sources.append(source_info)
-            except:
-                sources = []
+            # Fuentes de la búsqueda hecha para el streaming
+            sources = stream_result.get("sources", [])
             
             # Mostrar fuentes
-            if sources:
-                st.markdown("---")
-                st.markdown("**📚 Fuentes utilizadas:**")
-                for i, source in enumerate(sources, 1):
-                    source_name = source.get("source", "Unknown")
-                    score = source.get("score", 0.0)
-                    
-                    source_text = f"{i}. {source_name}"
-                    if score > 0:
-                        source_text += f" - Relevancia: {score:.2f}"
-                    
-                    st.caption(source_text)
+            sources_rendered = format_sources(sources)
+            render_sources(sources_rendered)
             
             # Convertir respuesta a voz si está disponible
             if speech_client and full_answer:
                 with st.spinner("🔊 Generando audio de la respuesta..."):
                     try:
                         audio_data = speech_client.text_to_speech(full_answer)
-                        st.audio(audio_data, format="audio/wav", autoplay=True)
+                        st.audio(audio_data, format="audio/ogg", autoplay=True)
                         st.success("✅ Audio generado. Reproduciendo respuesta...")
                     except Exception as tts_error:
                         st.warning(f"⚠️ No se pudo generar el audio: {str(tts_error)}")
@@ -222,7 +269,8 @@ def process_question(prompt: str, is_from_voice: bool = False):
             st.session_state.messages.append({
                 "role": "assistant",
                 "content": full_answer,
-                "sources": sources
+                "sources": sources,
+                "sources_rendered": sources_rendered
             })
                 
         except Exception as e:
@@ -233,6 +281,13 @@ def process_question(prompt: str, is_from_voice: bool = False):
                 "content": error_msg
             })
 
+def _extract(user_input, field: str):
+    """Lee un campo del valor de chat_input, ya sea como atributo o como clave de dict."""
+    value = getattr(user_input, field, None)
+    if value is None and isinstance(user_input, dict):
+        value = user_input.get(field)
+    return value
+
 # Sección de entrada: texto y voz integrados en un solo widget
 # Usar chat_input con accept_audio si speech_client está disponible
 if speech_client:
@@ -250,8 +305,8 @@ if speech_client:
             process_question(user_input, is_from_voice=False)
         else:
             # Objeto dict-like (puede tener text, audio, o ambos)
-            text_prompt = user_input.text if hasattr(user_input, 'text') else user_input.get('text', '')
-            audio_file = user_input.audio if hasattr(user_input, 'audio') else user_input.get('audio', None)
+            text_prompt = _extract(user_input, "text") or ""
+            audio_file = _extract(user_input, "audio")
             
             # Si hay audio, procesarlo primero
             if audio_file:
@@ -260,14 +315,9 @@ if speech_client:
                         # Leer los bytes del archivo de audio
                         audio_bytes = audio_file.read()
                         
-                        # Guardar audio temporalmente
-                        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp_file:
-                            tmp_file.write(audio_bytes)
-                            tmp_audio_path = tmp_file.name
-                        
                         try:
-                            # Convertir voz a texto
-                            transcribed_text = speech_client.speech_to_text_from_file(tmp_audio_path)
+                            # Convertir voz a texto directamente desde memoria
+                            transcribed_text = speech_client.speech_to_text_from_bytes(audio_bytes)
                             
                             if transcribed_text and transcribed_text.strip():
                                 # Usar el texto transcrito (o combinarlo con texto escrito si existe)
@@ -279,15 +329,9 @@ if speech_client:
                                 process_question(final_prompt, is_from_voice=True)
                             else:
                                 st.warning("⚠️ No se pudo transcribir el audio. Por favor, intenta de nuevo hablando más claro.")
-                            
-                            # Limpiar archivo temporal
-                            if os.path.exists(tmp_audio_path):
-                                os.unlink(tmp_audio_path)
                                 
                         except Exception as stt_error:
                             st.error(f"❌ Error al procesar el audio: {str(stt_error)}")
-                            if os.path.exists(tmp_audio_path):
-                                os.unlink(tmp_audio_path)
                             
                 except Exception as e:
                     st.error(f"❌ Error al procesar la grabación: {str(e)}")
@@ -1,35 +1,385 @@
 """
 Cliente para interactuar con Azure OpenAI.
 """
-from typing import List, Generator
-from openai import AzureOpenAI
+import re
+from functools import lru_cache
+from typing import TYPE_CHECKING, AsyncGenerator, Dict, List, Generator, Optional
 
 from app.config import AzureOpenAIConfig
 
+if TYPE_CHECKING:
+    import httpx
+
+
+# Patrones para clasificar errores de Azure OpenAI
+_RE_RATE = re.compile(r"429|RateLimitReached|rate[ _-]?limit", re.I)
+_RE_BAD = re.compile(r"\b400\b")
+
+
+class RateLimitError(Exception):
+    """Azure OpenAI rechazó la llamada por límite de tasa (HTTP 429)."""
+
+
+def _classify_azure_error(error: Exception) -> str:
+    """
+    Clasifica un error de Azure OpenAI.
+    
+    Usa el código HTTP que expone el SDK y, si no lo hay, el mensaje del error.
+    
+    Args:
+        error: Excepción original.
+    
+    Returns:
+        "rate_limit" (429), "bad_request" (400) u "other".
+    """
+    status_code = getattr(error, "status_code", None)
+    if status_code == 429:
+        return "rate_limit"
+    if status_code == 400:
+        return "bad_request"
+    
+    error_str = str(error)
+    if _RE_RATE.search(error_str):
+        return "rate_limit"
+    if _RE_BAD.search(error_str):
+        return "bad_request"
+    return "other"
+
+
+def _response_error(error: Exception) -> Exception:
+    """
+    Construye la excepción que lanzan las llamadas sin streaming cuando fallan.
+    
+    Args:
+        error: Excepción original.
+    
+    Returns:
+        RateLimitError si se alcanzó el límite de tasa; en otro caso, una
+        excepción con un mensaje pensado para el usuario.
+    """
+    error_kind = _classify_azure_error(error)
+    error_str = str(error)
+    
+    # Error 429: Rate Limit (límite de tasa alcanzado)
+    if error_kind == "rate_limit":
+        return RateLimitError(
+            "Límite de tasa alcanzado: Has excedido el límite de tokens por minuto de tu plan de Azure OpenAI. "
+            "Por favor, espera 60 segundos antes de intentar de nuevo. "
+            "Para aumentar el límite, visita: https://aka.ms/oai/quotaincrease"
+        )
+    
+    # Error 400: Bad Request
+    if error_kind == "bad_request":
+        return Exception(f"Error de solicitud: {error_str}")
+    
+    # Otros errores
+    return Exception(f"Error al generar respuesta con Azure OpenAI: {error_str}")
+
+
+def _stream_error_message(error: Exception) -> str:
+    """
+    Construye el mensaje que se emite al final de un stream cuando falla la llamada.
+    
+    Args:
+        error: Excepción original.
+    
+    Returns:
+        Texto en Markdown para mostrar al usuario.
+    """
+    error_kind = _classify_azure_error(error)
+    error_str = str(error)
+    
+    # Error 429: Rate Limit
+    if error_kind == "rate_limit":
+        return "\n\n⚠️ **Límite de tasa alcanzado**: Has excedido el límite de tokens por minuto. Espera 60 segundos antes de intentar de nuevo."
+    
+    # Error 400: Bad Request
+    if error_kind == "bad_request":
+        return f"\n\n❌ **Error de solicitud**: {error_str}"
+    
+    # Otros errores
+    return f"\n\n❌ **Error**: {error_str}"
+
+
+# Partes estáticas del prompt del usuario (se construyen una sola vez).
+# Las instrucciones invariantes van antes del contexto para que el inicio del prompt
+# sea idéntico entre consultas y el servidor pueda reutilizar la cache de prefijo.
+_USER_TEMPLATE_HEAD = (
+    "Basándote en el contexto proporcionado, responde la pregunta del usuario. "
+    "Si encuentras información relevante, aunque sea parcial, compártela. "
+    "Si el contexto menciona algo relacionado con la pregunta, inclúyelo en tu respuesta.\n\n"
+    "Contexto de los manuales técnicos:\n\n"
+)
+_USER_TEMPLATE_TAIL = "\n\n---\n\nPregunta del usuario: {q}"
+
+
+# Presupuesto máximo de tokens para el contexto enviado al modelo
+MAX_CONTEXT_TOKENS = 6000
+
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    """
+    Devuelve (y cachea) el tokenizer cl100k_base usado por los modelos GPT-4/GPT-3.5.
+    
+    La primera carga descarga el vocabulario BPE. Si falla (sin tiktoken o sin acceso
+    a la URL de descarga) devuelve None, también cacheado para no reintentar la
+    descarga en cada pregunta; el contexto queda limitado solo por caracteres.
+    """
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+@lru_cache(maxsize=256)
+def _encode(chunk: str) -> tuple:
+    """Tokeniza un fragmento; se cachea porque los mismos fragmentos se repiten entre turnos."""
+    return tuple(_get_encoding().encode(chunk))
+
+
+def _apply_token_budget(context_chunks: List[str], budget: int = MAX_CONTEXT_TOKENS) -> List[str]:
+    """
+    Limita los fragmentos de contexto a un presupuesto de tokens.
+    
+    Los fragmentos se incluyen en orden; el primero que no cabe se recorta a los
+    tokens restantes y los siguientes se descartan. Si el tokenizer no está
+    disponible, se devuelven sin cambios (ya vienen limitados por caracteres
+    desde el pipeline RAG).
+    
+    Args:
+        context_chunks: Lista de fragmentos de texto del contexto recuperado.
+        budget: Máximo de tokens de contexto.
+    
+    Returns:
+        Lista de fragmentos que caben en el presupuesto.
+    """
+    encoding = _get_encoding()
+    if encoding is None:
+        return context_chunks
+    
+    selected = []
+    used = 0
+    try:
+        for chunk in context_chunks:
+            tokens = _encode(chunk)
+            if used + len(tokens) > budget:
+                remaining = budget - used
+                if remaining > 0:
+                    selected.append(encoding.decode(list(tokens[:remaining])) + "... [texto truncado]")
+                break
+            selected.append(chunk)
+            used += len(tokens)
+    except Exception:
+        # El presupuesto de tokens es una optimización: si falla la tokenización,
+        # enviar el contexto tal cual (limitado por caracteres)
+        return context_chunks
+    return selected
+
+
+@lru_cache(maxsize=32)
+def _format_context(context_chunks: tuple) -> str:
+    """
+    Concatena los fragmentos de contexto numerados.
+    
+    Se cachea por contenido para no reconstruir el texto cuando se regenera una
+    respuesta con los mismos fragmentos (por ejemplo, al cambiar la temperatura).
+    
+    Args:
+        context_chunks: Tupla de fragmentos de texto del contexto recuperado.
+    
+    Returns:
+        Texto del contexto listo para insertar en el prompt.
+    """
+    return "\n\n".join(
+        "[Fragmento %d]\n%s" % (i, chunk)
+        for i, chunk in enumerate(context_chunks, 1)
+    )
+
 
 class AzureOpenAIClient:
     """Cliente para generar respuestas usando Azure OpenAI."""
     
-    def __init__(self, config: AzureOpenAIConfig):
+    def __init__(
+        self,
+        config: AzureOpenAIConfig,
+        http_client: Optional["httpx.Client"] = None,
+        async_http_client: Optional["httpx.AsyncClient"] = None
+    ):
         """
         Inicializa el cliente de Azure OpenAI.
         
         Args:
             config: Configuración de Azure OpenAI.
+            http_client: Cliente HTTP compartido (pool de conexiones). Si es None,
+                        el SDK crea uno propio.
+            async_http_client: Cliente HTTP asíncrono compartido para AsyncAzureOpenAI.
         """
+        # Importar el SDK aquí para no pagar su carga al importar el módulo
+        from openai import AsyncAzureOpenAI, AzureOpenAI
+        
         self.config = config
         self.client = AzureOpenAI(
             azure_endpoint=config.endpoint,
             api_key=config.api_key,
-            api_version="2024-02-15-preview"  # Versión que soporta chat completions
+            api_version="2024-02-15-preview",  # Versión que soporta chat completions
+            http_client=http_client
         )
+        # Cliente asíncrono para las variantes async
+        self.async_client = AsyncAzureOpenAI(
+            azure_endpoint=config.endpoint,
+            api_key=config.api_key,
+            api_version="2024-02-15-preview",
+            http_client=async_http_client
+        )
+    
+    @staticmethod
+    def prepare_tokenizer():
+        """
+        Carga el tokenizer usado para limitar el contexto (la primera carga lee
+        el vocabulario BPE), para no pagarla al construir el primer prompt.
+        """
+        _get_encoding()
+    
+    @staticmethod
+    def _build_messages(
+        system_prompt: str,
+        user_message: str,
+        context_chunks: List[str],
+        pre_messages: Optional[List[Dict[str, str]]] = None
+    ) -> List[Dict[str, str]]:
+        """
+        Construye los mensajes de chat (sistema + usuario con contexto).
+        
+        El contexto se limita a MAX_CONTEXT_TOKENS antes de construir el prompt.
+        
+        Args:
+            system_prompt: Instrucciones del sistema para el modelo.
+            user_message: Pregunta o mensaje del usuario.
+            context_chunks: Lista de fragmentos de texto del contexto recuperado.
+            pre_messages: Mensajes iniciales ya construidos (ver generate_response).
+        
+        Returns:
+            Lista de mensajes en formato chat.
+        """
+        parts = [
+            _USER_TEMPLATE_HEAD,
+            _format_context(tuple(_apply_token_budget(context_chunks))),
+            _USER_TEMPLATE_TAIL.format(q=user_message)
+        ]
+        
+        user_msg = {"role": "user", "content": "".join(parts)}
+        if pre_messages is not None:
+            return [*pre_messages, user_msg]
+        return [{"role": "system", "content": system_prompt}, user_msg]
+    
+    def _create_completion(self, call_params: Dict):
+        """
+        Llama a chat completions, reintentando sin temperature si el modelo no lo soporta.
+        
+        Args:
+            call_params: Parámetros de la llamada (se modifica si hay reintento).
+        
+        Returns:
+            Respuesta (o stream) del SDK de OpenAI.
+        """
+        try:
+            return self.client.chat.completions.create(**call_params)
+        except Exception as temp_error:
+            # Si falla por temperature no soportado, reintentar sin ese parámetro
+            error_str = str(temp_error).lower()
+            if "temperature" in error_str and "unsupported" in error_str:
+                # Reintentar sin temperature (usará el valor por defecto del modelo)
+                call_params.pop("temperature", None)
+                return self.client.chat.completions.create(**call_params)
+            # Si es otro error, relanzarlo
+            raise
+    
+    async def _acreate_completion(self, call_params: Dict):
+        """Versión asíncrona de _create_completion (usa AsyncAzureOpenAI)."""
+        try:
+            return await self.async_client.chat.completions.create(**call_params)
+        except Exception as temp_error:
+            error_str = str(temp_error).lower()
+            if "temperature" in error_str and "unsupported" in error_str:
+                call_params.pop("temperature", None)
+                return await self.async_client.chat.completions.create(**call_params)
+            raise
+    
+    def _call_params(
+        self,
+        system_prompt: str,
+        user_message: str,
+        context_chunks: List[str],
+        temperature: float,
+        stream: bool = False,
+        pre_messages: Optional[List[Dict[str, str]]] = None,
+        max_tokens: int = 800
+    ) -> Dict:
+        """
+        Prepara los parámetros de chat completions.
+        
+        Args:
+            system_prompt: Instrucciones del sistema para el modelo.
+            user_message: Pregunta o mensaje del usuario.
+            context_chunks: Lista de fragmentos de texto del contexto recuperado.
+            temperature: Temperatura para la generación (0.0-1.0).
+            stream: Si es True, activa el streaming de la respuesta.
+            pre_messages: Mensajes iniciales ya construidos (ver generate_response).
+            max_tokens: Máximo de tokens de la respuesta.
+        
+        Returns:
+            Diccionario de parámetros para chat.completions.create.
+        """
+        call_params = {
+            "model": self.config.deployment_name,
+            "messages": self._build_messages(system_prompt, user_message, context_chunks, pre_messages),
+            "max_completion_tokens": max_tokens  # 800 por defecto, para respuestas más completas
+        }
+        if stream:
+            call_params["stream"] = True  # Activar streaming
+        
+        # Solo añadir temperature si es diferente de 1.0
+        # Algunos modelos solo soportan temperature=1 (valor por defecto); si el
+        # modelo no lo soporta, se reintenta sin este parámetro
+        if temperature != 1.0:
+            call_params["temperature"] = temperature
+        return call_params
+    
+    def embed(self, text: str) -> List[float]:
+        """
+        Calcula el embedding de un texto con el deployment de embeddings configurado.
+        
+        Args:
+            text: Texto a convertir en embedding.
+        
+        Returns:
+            Vector de embedding.
+        
+        Raises:
+            ValueError: Si no hay deployment de embeddings configurado.
+        """
+        if not self.config.embedding_deployment:
+            raise ValueError("No hay deployment de embeddings configurado (AZURE_OPENAI_EMBEDDING_DEPLOYMENT)")
+        
+        try:
+            response = self.client.embeddings.create(
+                model=self.config.embedding_deployment,
+                input=text
+            )
+            return response.data[0].embedding
+        except Exception as e:
+            raise Exception(f"Error al generar embedding con Azure OpenAI: {str(e)}")
     
     def generate_response(
         self,
         system_prompt: str,
         user_message: str,
         context_chunks: List[str],
-        temperature: float = 0.2
+        temperature: float = 0.2,
+        pre_messages: Optional[List[Dict[str, str]]] = None,
+        max_tokens: int = 800
     ) -> str:
         """
         Genera una respuesta usando Azure OpenAI con el contexto proporcionado.
@@ -40,60 +390,22 @@ class AzureOpenAIClient:
             context_chunks: Lista de fragmentos de texto del contexto recuperado.
             temperature: Temperatura para la generación (0.0-1.0). Valores más bajos
                         dan respuestas más deterministas.
+            pre_messages: Mensajes iniciales ya construidos (por ejemplo, el mensaje de
+                         sistema precalculado). Si se indican, sustituyen a system_prompt.
+            max_tokens: Máximo de tokens de la respuesta.
         
         Returns:
             Texto de la respuesta generada por el modelo.
         """
         try:
-            # Construir el contexto concatenando los chunks
-            context_text = "\n\n".join([
-                f"[Fragmento {i+1}]\n{chunk}"
-                for i, chunk in enumerate(context_chunks)
-            ])
-            
-            # Construir el prompt del usuario con el contexto
-            user_prompt_with_context = f"""Contexto de los manuales técnicos:
-
-{context_text}
-
----
-
-Pregunta del usuario: {user_message}
-
-Basándote en el contexto proporcionado, responde la pregunta del usuario. Si encuentras información relevante, aunque sea parcial, compártela. Si el contexto menciona algo relacionado con la pregunta, inclúyelo en tu respuesta."""
-            
-            # Preparar mensajes en formato chat
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt_with_context}
-            ]
-            
             # Preparar parámetros de la llamada
-            # Algunos modelos solo soportan temperature=1 (valor por defecto)
-            call_params = {
-                "model": self.config.deployment_name,
-                "messages": messages,
-                "max_completion_tokens": 800  # Aumentado para respuestas más completas
-            }
-            
-            # Solo añadir temperature si es diferente de 1.0
-            # Si el modelo no lo soporta, se intentará sin este parámetro
-            if temperature != 1.0:
-                call_params["temperature"] = temperature
+            call_params = self._call_params(
+                system_prompt, user_message, context_chunks, temperature,
+                pre_messages=pre_messages, max_tokens=max_tokens
+            )
             
             # Llamar al modelo
-            try:
-                response = self.client.chat.completions.create(**call_params)
-            except Exception as temp_error:
-                # Si falla por temperature no soportado, reintentar sin ese parámetro
-                error_str = str(temp_error)
-                if "temperature" in error_str.lower() and "unsupported" in error_str.lower():
-                    # Reintentar sin temperature (usará el valor por defecto del modelo)
-                    call_params.pop("temperature", None)
-                    response = self.client.chat.completions.create(**call_params)
-                else:
-                    # Si es otro error, relanzarlo
-                    raise
+            response = self._create_completion(call_params)
             
             # Extraer y retornar el texto de la respuesta
             if response.choices and len(response.choices) > 0:
@@ -103,30 +415,51 @@ Basándote en el contexto proporcionado, responde la pregunta del usuario. Si en
                 
         except Exception as e:
             # Detectar errores específicos de Azure OpenAI
-            error_str = str(e)
-            
-            # Error 429: Rate Limit (límite de tasa alcanzado)
-            if "429" in error_str or "RateLimitReached" in error_str or "rate limit" in error_str.lower():
-                raise Exception(
-                    "Límite de tasa alcanzado: Has excedido el límite de tokens por minuto de tu plan de Azure OpenAI. "
-                    "Por favor, espera 60 segundos antes de intentar de nuevo. "
-                    "Para aumentar el límite, visita: https://aka.ms/oai/quotaincrease"
-                )
-            
-            # Error 400: Bad Request
-            elif "400" in error_str:
-                raise Exception(f"Error de solicitud: {error_str}")
+            raise _response_error(e)
+    
+    async def agenerate_response(
+        self,
+        system_prompt: str,
+        user_message: str,
+        context_chunks: List[str],
+        temperature: float = 0.2,
+        pre_messages: Optional[List[Dict[str, str]]] = None
+    ) -> str:
+        """
+        Versión asíncrona de generate_response (usa AsyncAzureOpenAI).
+        
+        Args:
+            system_prompt: Instrucciones del sistema para el modelo.
+            user_message: Pregunta o mensaje del usuario.
+            context_chunks: Lista de fragmentos de texto del contexto recuperado.
+            temperature: Temperatura para la generación (0.0-1.0).
+            pre_messages: Mensajes iniciales ya construidos (por ejemplo, el mensaje de
+                         sistema precalculado). Si se indican, sustituyen a system_prompt.
+        
+        Returns:
+            Texto de la respuesta generada por el modelo.
+        """
+        try:
+            call_params = self._call_params(
+                system_prompt, user_message, context_chunks, temperature, pre_messages=pre_messages
+            )
+            response = await self._acreate_completion(call_params)
             
-            # Otros errores
+            if response.choices and len(response.choices) > 0:
+                return response.choices[0].message.content.strip()
             else:
-                raise Exception(f"Error al generar respuesta con Azure OpenAI: {error_str}")
+                return "No se pudo generar una respuesta."
+                
+        except Exception as e:
+            raise _response_error(e)
     
     def generate_response_stream(
         self,
         system_prompt: str,
         user_message: str,
         context_chunks: List[str],
-        temperature: float = 1.0
+        temperature: float = 1.0,
+        pre_messages: Optional[List[Dict[str, str]]] = None
     ) -> Generator[str, None, None]:
         """
         Genera una respuesta usando Azure OpenAI con streaming (carácter por carácter).
@@ -136,57 +469,20 @@ Basándote en el contexto proporcionado, responde la pregunta del usuario. Si en
             user_message: Pregunta o mensaje del usuario.
             context_chunks: Lista de fragmentos de texto del contexto recuperado.
             temperature: Temperatura para la generación (0.0-1.0).
+            pre_messages: Mensajes iniciales ya construidos (por ejemplo, el mensaje de
+                         sistema precalculado). Si se indican, sustituyen a system_prompt.
         
         Yields:
             Fragmentos de texto de la respuesta conforme se generan.
         """
         try:
-            # Construir el contexto concatenando los chunks
-            context_text = "\n\n".join([
-                f"[Fragmento {i+1}]\n{chunk}"
-                for i, chunk in enumerate(context_chunks)
-            ])
-            
-            # Construir el prompt del usuario con el contexto
-            user_prompt_with_context = f"""Contexto de los manuales técnicos:
-
-{context_text}
-
----
-
-Pregunta del usuario: {user_message}
-
-Basándote en el contexto proporcionado, responde la pregunta del usuario. Si encuentras información relevante, aunque sea parcial, compártela. Si el contexto menciona algo relacionado con la pregunta, inclúyelo en tu respuesta."""
-            
-            # Preparar mensajes en formato chat
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt_with_context}
-            ]
-            
             # Preparar parámetros de la llamada con streaming
-            call_params = {
-                "model": self.config.deployment_name,
-                "messages": messages,
-                "max_completion_tokens": 800,
-                "stream": True  # Activar streaming
-            }
-            
-            # Solo añadir temperature si es diferente de 1.0
-            if temperature != 1.0:
-                call_params["temperature"] = temperature
+            call_params = self._call_params(
+                system_prompt, user_message, context_chunks, temperature, stream=True, pre_messages=pre_messages
+            )
             
             # Llamar al modelo con streaming
-            try:
-                stream = self.client.chat.completions.create(**call_params)
-            except Exception as temp_error:
-                # Si falla por temperature no soportado, reintentar sin ese parámetro
-                error_str = str(temp_error)
-                if "temperature" in error_str.lower() and "unsupported" in error_str.lower():
-                    call_params.pop("temperature", None)
-                    stream = self.client.chat.completions.create(**call_params)
-                else:
-                    raise
+            stream = self._create_completion(call_params)
             
             # Yielding fragmentos conforme se reciben
             for chunk in stream:
@@ -197,17 +493,41 @@ Basándote en el contexto proporcionado, responde la pregunta del usuario. Si en
                         
         except Exception as e:
             # Detectar errores específicos de Azure OpenAI
-            error_str = str(e)
-            
-            # Error 429: Rate Limit
-            if "429" in error_str or "RateLimitReached" in error_str or "rate limit" in error_str.lower():
-                yield f"\n\n⚠️ **Límite de tasa alcanzado**: Has excedido el límite de tokens por minuto. Espera 60 segundos antes de intentar de nuevo."
-            
-            # Error 400: Bad Request
-            elif "400" in error_str:
-                yield f"\n\n❌ **Error de solicitud**: {error_str}"
+            yield _stream_error_message(e)
+    
+    async def agenerate_response_stream(
+        self,
+        system_prompt: str,
+        user_message: str,
+        context_chunks: List[str],
+        temperature: float = 1.0,
+        pre_messages: Optional[List[Dict[str, str]]] = None
+    ) -> AsyncGenerator[str, None]:
+        """
+        Versión asíncrona de generate_response_stream (usa AsyncAzureOpenAI).
+        
+        Args:
+            system_prompt: Instrucciones del sistema para el modelo.
+            user_message: Pregunta o mensaje del usuario.
+            context_chunks: Lista de fragmentos de texto del contexto recuperado.
+            temperature: Temperatura para la generación (0.0-1.0).
+            pre_messages: Mensajes iniciales ya construidos (por ejemplo, el mensaje de
+                         sistema precalculado). Si se indican, sustituyen a system_prompt.
+        
+        Yields:
+            Fragmentos de texto de la respuesta conforme se generan.
+        """
+        try:
+            call_params = self._call_params(
+                system_prompt, user_message, context_chunks, temperature, stream=True, pre_messages=pre_messages
+            )
+            stream = await self._acreate_completion(call_params)
             
-            # Otros errores
-            else:
-                yield f"\n\n❌ **Error**: {error_str}"
-
+            async for chunk in stream:
+                if chunk.choices and len(chunk.choices) > 0:
+                    delta = chunk.choices[0].delta
+                    if delta and delta.content:
+                        yield delta.content
+                        
+        except Exception as e:
+            yield _stream_error_message(e)
@@ -1,31 +1,120 @@
 """
 Cliente para interactuar con Azure AI Search.
 """
-from typing import List, Dict
-from azure.core.credentials import AzureKeyCredential
-from azure.search.documents import SearchClient
+import asyncio
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, List, Optional
 
 from app.config import AzureSearchConfig
 
+if TYPE_CHECKING:
+    import httpx
+
+
+# Campos del índice que se usan al mapear resultados
+_SELECT_FIELDS = ["content", "metadata_storage_name", "metadata_storage_path"]
+
+# Azure AI Search devuelve hasta 50 resultados por página
+_PAGE_SIZE = 50
+
+
+@dataclass(slots=True, frozen=True)
+class SearchHit:
+    """Documento devuelto por Azure AI Search, con los campos del índice ya mapeados."""
+    content: str
+    source: str
+    path: str
+    score: float
+
 
 class AzureSearchClient:
     """Cliente para realizar búsquedas en Azure AI Search."""
     
-    def __init__(self, config: AzureSearchConfig):
+    def __init__(
+        self,
+        config: AzureSearchConfig,
+        http_client: Optional["httpx.Client"] = None,
+        async_http_client: Optional["httpx.AsyncClient"] = None,
+        loop: Optional[asyncio.AbstractEventLoop] = None
+    ):
         """
         Inicializa el cliente de Azure AI Search.
         
         Args:
             config: Configuración de Azure AI Search.
+            http_client: Cliente HTTP compartido (pool de conexiones). Si es None,
+                        el SDK usa su transporte por defecto. No se usa si se indica loop.
+            async_http_client: Cliente HTTP asíncrono compartido para el cliente aio.
+                              Si es None, se usa el transporte aiohttp por defecto.
+            loop: Event loop en segundo plano. Si se indica, search_documents ejecuta
+                  la búsqueda asíncrona en ese loop para mantener sus conexiones vivas
+                  entre llamadas, y no se crea el cliente síncrono.
         """
+        # Importar el SDK aquí para no pagar su carga al importar el módulo
+        from azure.core.credentials import AzureKeyCredential
+        from azure.search.documents import SearchClient
+        from azure.search.documents.aio import SearchClient as AsyncSearchClient
+        
         self.config = config
-        self.client = SearchClient(
+        self._loop = loop
+        
+        # Cliente síncrono: solo hace falta si no hay loop en segundo plano
+        self.client: Optional[SearchClient] = None
+        if loop is None:
+            client_options = {}
+            if http_client is not None:
+                # Reutilizar el pool de conexiones compartido con Azure OpenAI
+                from azure.core.experimental.transport import HttpXTransport
+                client_options["transport"] = HttpXTransport(client=http_client, client_owner=False)
+            
+            self.client = SearchClient(
+                endpoint=config.endpoint,
+                index_name=config.index_name,
+                credential=AzureKeyCredential(config.api_key),
+                **client_options
+            )
+        
+        async_client_options = {}
+        if async_http_client is not None:
+            # Reutilizar el pool asíncrono (HTTP/2) compartido con Azure OpenAI
+            from azure.core.experimental.transport import AsyncHttpXTransport
+            async_client_options["transport"] = AsyncHttpXTransport(
+                client=async_http_client,
+                client_owner=False
+            )
+        
+        # Cliente asíncrono para asearch_documents (transporte aiohttp por defecto)
+        self.async_client = AsyncSearchClient(
             endpoint=config.endpoint,
             index_name=config.index_name,
-            credential=AzureKeyCredential(config.api_key)
+            credential=AzureKeyCredential(config.api_key),
+            **async_client_options
         )
     
-    def search_documents(self, query: str, top_k: int = 5) -> List[Dict]:
+    @staticmethod
+    def _search_options(query: str, top_k: int) -> dict:
+        """Parámetros de la búsqueda textual estándar sobre el campo 'content'."""
+        return {
+            "search_text": query,
+            "top": top_k,
+            # Pedir solo los campos que se usan (el score se devuelve siempre)
+            "select": _SELECT_FIELDS
+        }
+    
+    @staticmethod
+    def _to_hit(result: dict) -> SearchHit:
+        """Mapea un resultado de Azure AI Search a SearchHit."""
+        return SearchHit(
+            content=result.get("content", ""),
+            # Mapear metadata_storage_name -> source (nombre del PDF)
+            source=result.get("metadata_storage_name", "Unknown"),
+            # Mapear metadata_storage_path -> path (clave del documento)
+            path=result.get("metadata_storage_path", ""),
+            # Score de relevancia de Azure AI Search
+            score=result.get("@search.score", 0.0)
+        )
+    
+    def search_documents(self, query: str, top_k: int = 5) -> List[SearchHit]:
         """
         Busca documentos relevantes en el índice usando búsqueda textual sobre el campo 'content'.
         
@@ -39,36 +128,30 @@ class AzureSearchClient:
             top_k: Número máximo de documentos a retornar.
         
         Returns:
-            Lista de diccionarios con documentos encontrados. Cada documento contiene:
-            - "content": texto del campo content
-            - "source": nombre del archivo PDF (desde metadata_storage_name)
-            - "path": ruta del documento (desde metadata_storage_path, para depuración)
-            - "score": score de relevancia de la búsqueda
+            Lista de SearchHit con los documentos encontrados. Cada documento contiene:
+            - content: texto del campo content
+            - source: nombre del archivo PDF (desde metadata_storage_name)
+            - path: ruta del documento (desde metadata_storage_path, para depuración)
+            - score: score de relevancia de la búsqueda
         """
+        # Con un loop en segundo plano, delegar en el cliente asíncrono
+        # (asearch_documents ya traduce los errores)
+        if self._loop is not None:
+            return asyncio.run_coroutine_threadsafe(
+                self.asearch_documents(query=query, top_k=top_k),
+                self._loop
+            ).result()
+        
         try:
-            # Búsqueda textual estándar sobre el campo 'content'
-            search_options = {
-                "search_text": query,
-                "top": top_k,
-                "include_total_count": True
-            }
+            # Ejecutar búsqueda textual estándar sobre el campo 'content'
+            results = self.client.search(**self._search_options(query, top_k))
             
-            # Ejecutar búsqueda
-            results = self.client.search(**search_options)
+            # Si todos los resultados caben en una página, leer solo esa página
+            if top_k <= _PAGE_SIZE:
+                results = next(results.by_page(), [])
             
             # Procesar resultados y mapear campos del índice real
-            documents = []
-            for result in results:
-                doc = {
-                    "content": result.get("content", ""),
-                    # Mapear metadata_storage_name -> source (nombre del PDF)
-                    "source": result.get("metadata_storage_name", "Unknown"),
-                    # Mapear metadata_storage_path -> path (clave del documento)
-                    "path": result.get("metadata_storage_path", ""),
-                    # Score de relevancia de Azure AI Search
-                    "score": result.get("@search.score", 0.0)
-                }
-                documents.append(doc)
+            documents = [self._to_hit(result) for result in results]
             
             return documents
             
@@ -76,7 +159,32 @@ class AzureSearchClient:
             # Manejo básico de errores
             raise Exception(f"Error al buscar en Azure AI Search: {str(e)}")
     
-    def search_documents_text_only(self, query: str, top_k: int = 5) -> List[Dict]:
+    async def asearch_documents(self, query: str, top_k: int = 5) -> List[SearchHit]:
+        """
+        Versión asíncrona de search_documents (usa el SearchClient de azure.search.documents.aio).
+        
+        Args:
+            query: Texto de búsqueda del usuario.
+            top_k: Número máximo de documentos a retornar.
+        
+        Returns:
+            Lista de SearchHit con los documentos encontrados.
+        """
+        try:
+            results = await self.async_client.search(**self._search_options(query, top_k))
+            
+            # Si todos los resultados caben en una página, leer solo esa página
+            if top_k <= _PAGE_SIZE:
+                async for page in results.by_page():
+                    return [self._to_hit(result) async for result in page]
+                return []
+            
+            return [self._to_hit(result) async for result in results]
+            
+        except Exception as e:
+            raise Exception(f"Error al buscar en Azure AI Search: {str(e)}")
+    
+    def search_documents_text_only(self, query: str, top_k: int = 5) -> List[SearchHit]:
         """
         Busca documentos usando solo búsqueda por texto (sin vectores).
         Método de conveniencia que llama a search_documents.
@@ -1,24 +1,111 @@
 """
 Cliente para interactuar con Azure Speech Services (STT y TTS).
 """
+import asyncio
+import hashlib
 import io
+import os
+import tempfile
+import threading
+import time
+import wave
+from bisect import bisect_right
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 import azure.cognitiveservices.speech as speechsdk
-from typing import Optional
+from typing import Callable, Generator, List, Optional, Tuple, Union
 from app.config import AzureSpeechConfig
+from app.services.single_flight import SingleFlight
+
+
+# Formato de salida de TTS y extensión de los archivos de la cache en disco
+_TTS_OUTPUT_FORMAT = speechsdk.SpeechSynthesisOutputFormat.Ogg24Khz16BitMonoOpus
+_TTS_FILE_EXT = ".ogg"
+
+# Antigüedad a partir de la cual un archivo temporal de la cache en disco se
+# considera abandonado (escritura interrumpida) y se borra al limpiar la cache
+_TTS_TMP_MAX_AGE = 3600.0
+
+# Hilos del pool de síntesis asíncrona; también es el máximo de sintetizadores libres
+# que se conservan (cada uno mantiene abierta una conexión con el servicio)
+_TTS_POOL_SIZE = 8
+
+# Audio PCM por defecto del SDK (16 kHz, 16 bits, mono) y silencio que separa
+# los audios de recognize_batch, suficiente para que el servicio corte la frase
+_PCM_BYTES_PER_SECOND = 16000 * 2
+_BATCH_SILENCE = bytes(_PCM_BYTES_PER_SECOND)
+
+# Espera máxima del reconocimiento continuo: margen fijo + un múltiplo de la
+# duración del audio (el servicio lo procesa más rápido que en tiempo real)
+_RECOGNITION_TIMEOUT_BASE = 30.0
+_RECOGNITION_TIMEOUT_FACTOR = 2.0
+
+
+class _BytesPullCallback(speechsdk.audio.PullAudioInputStreamCallback):
+    """Callback de PullAudioInputStream que entrega al SDK trozos de unos bytes en memoria."""
+    
+    def __init__(self, data):
+        super().__init__()
+        self._view = memoryview(data)
+        self._pos = 0
+    
+    def read(self, buffer: memoryview) -> int:
+        size = min(buffer.nbytes, len(self._view) - self._pos)
+        buffer[:size] = self._view[self._pos:self._pos + size]
+        self._pos += size
+        return size
+    
+    def close(self):
+        pass
 
 
 class AzureSpeechClient:
     """Cliente para convertir voz a texto (STT) y texto a voz (TTS) usando Azure Speech Services."""
     
-    def __init__(self, config: AzureSpeechConfig):
+    def __init__(
+        self,
+        config: AzureSpeechConfig,
+        cache_dir: Optional[Union[str, Path]] = None,
+        cache_size: int = 256,
+        ttl_seconds: Optional[float] = None,
+        disk_cache_max_bytes: int = 256 * 1024 * 1024
+    ):
         """
         Inicializa el cliente de Azure Speech Services.
         
         Args:
             config: Configuración de Azure Speech Services.
+            cache_dir: Directorio para la cache en disco de audios TTS. Si es None,
+                       solo se usa la cache en memoria.
+            cache_size: Número máximo de audios en la cache en memoria (LRU).
+            ttl_seconds: Antigüedad máxima de un audio cacheado. Si es None, no caduca.
+            disk_cache_max_bytes: Tamaño máximo de la cache en disco; al superarlo se
+                                  borran los audios más antiguos.
         """
         self.config = config
         
+        # Cache de TTS: memoria (LRU) + disco, indexada por (voz, formato, texto)
+        self._tts_cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._tts_cache_lock = threading.Lock()
+        self._tts_cache_size = cache_size
+        self._tts_ttl = ttl_seconds
+        self._tts_cache_dir = Path(cache_dir) if cache_dir else None
+        self._tts_disk_max_bytes = disk_cache_max_bytes
+        self._tts_disk_lock = threading.Lock()
+        self._tts_disk_bytes = 0
+        if self._tts_cache_dir:
+            try:
+                self._tts_cache_dir.mkdir(parents=True, exist_ok=True)
+                self._tts_disk_prune()
+            except OSError:
+                # La cache en disco es opcional: si el directorio no es escribible,
+                # seguir solo con memoria
+                self._tts_cache_dir = None
+        
+        # Síntesis en curso por clave de cache: textos idénticos concurrentes comparten una llamada
+        self._tts_flight = SingleFlight()
+        
         # Configurar credenciales de Azure Speech
         self.speech_config = speechsdk.SpeechConfig(
             subscription=config.api_key,
@@ -34,39 +121,37 @@ class AzureSpeechClient:
             self.speech_config.speech_synthesis_voice_name = config.voice_name or "es-ES-ElviraNeural"
         else:
             self.speech_config.speech_synthesis_voice_name = config.voice_name or "en-US-JennyNeural"
+        
+        # Configurar formato de audio de TTS una sola vez (Opus en OGG, 24kHz mono)
+        self.speech_config.set_speech_synthesis_output_format(_TTS_OUTPUT_FORMAT)
+        
+        # Sintetizadores persistentes en memoria, reutilizados entre llamadas para no abrir
+        # una conexión nueva cada vez. El SDK procesa las solicitudes de una instancia en
+        # serie, así que cada síntesis toma uno libre (o crea otro) y lo devuelve al terminar:
+        # las síntesis de usuarios distintos se ejecutan en paralelo
+        self._idle_synthesizers: List[speechsdk.SpeechSynthesizer] = []
+        self._synthesizers_lock = threading.Lock()
+        
+        # Pool para la síntesis asíncrona
+        self._tts_pool = ThreadPoolExecutor(max_workers=_TTS_POOL_SIZE, thread_name_prefix="tts")
     
-    def speech_to_text(self, audio_data: bytes, audio_format: str = "wav") -> Optional[str]:
+    def _recognize_once(self, audio_config, error_prefix: str) -> Optional[str]:
         """
-        Convierte audio a texto usando Azure Speech-to-Text.
+        Reconoce una sola frase desde la entrada de audio indicada.
         
         Args:
-            audio_data: Datos de audio en bytes.
-            audio_format: Formato del audio ("wav", "mp3", etc.). Por defecto "wav".
+            audio_config: Configuración de entrada de audio del SDK.
+            error_prefix: Prefijo del mensaje de error si falla el reconocimiento.
         
         Returns:
-            Texto transcrito o None si hay error.
+            Texto transcrito o None si no se reconoció voz.
         """
         try:
-            # Configurar formato de audio
-            if audio_format.lower() == "wav":
-                audio_stream = speechsdk.audio.PushAudioInputStream()
-                audio_config = speechsdk.audio.AudioConfig(stream=audio_stream)
-            else:
-                # Para otros formatos, usar el stream directamente
-                audio_stream = speechsdk.audio.PushAudioInputStream()
-                audio_config = speechsdk.audio.AudioConfig(stream=audio_stream)
-            
-            # Crear reconocedor de voz
             speech_recognizer = speechsdk.SpeechRecognizer(
                 speech_config=self.speech_config,
                 audio_config=audio_config
             )
             
-            # Escribir datos de audio al stream
-            audio_stream.write(audio_data)
-            audio_stream.close()
-            
-            # Realizar reconocimiento
             result = speech_recognizer.recognize_once()
             
             if result.reason == speechsdk.ResultReason.RecognizedSpeech:
@@ -80,39 +165,283 @@ class AzureSpeechClient:
                 return None
                 
         except Exception as e:
-            raise Exception(f"Error al convertir voz a texto: {str(e)}")
+            raise Exception(f"{error_prefix}: {str(e)}")
+    
+    def speech_to_text(self, audio_data: bytes, audio_format: str = "wav") -> Optional[str]:
+        """
+        Convierte audio a texto usando Azure Speech-to-Text.
+        
+        El SDK lee el audio directamente de los bytes del llamador (sin copiarlo a un
+        buffer intermedio).
+        
+        Args:
+            audio_data: Datos de audio en bytes (PCM 16 kHz, 16 bits, mono).
+            audio_format: Se mantiene por compatibilidad; el audio se envía tal cual.
+        
+        Returns:
+            Texto transcrito o None si hay error.
+        """
+        audio_config = speechsdk.audio.AudioConfig(
+            stream=speechsdk.audio.PullAudioInputStream(_BytesPullCallback(audio_data))
+        )
+        return self._recognize_once(audio_config, "Error al convertir voz a texto")
     
     def speech_to_text_from_file(self, audio_file_path: str) -> Optional[str]:
         """
-        Convierte un archivo de audio a texto.
+        Convierte un archivo de audio a texto. Usa reconocimiento continuo, así
+        que transcribe archivos de cualquier duración (no solo la primera frase).
         
         Args:
             audio_file_path: Ruta al archivo de audio.
         
         Returns:
-            Texto transcrito o None si hay error.
+            Texto transcrito o None si no se reconoció voz.
         """
         try:
             audio_config = speechsdk.audio.AudioConfig(filename=audio_file_path)
-            speech_recognizer = speechsdk.SpeechRecognizer(
-                speech_config=self.speech_config,
-                audio_config=audio_config
+            # Duración estimada como PCM 16 kHz, 16 bits, mono (el formato habitual de WAV)
+            audio_seconds = os.path.getsize(audio_file_path) / _PCM_BYTES_PER_SECOND
+            phrases = self._recognize_continuous(audio_config, audio_seconds)
+        except Exception as e:
+            raise Exception(f"Error al convertir voz a texto desde archivo: {str(e)}")
+        
+        if not phrases:
+            return None
+        return " ".join(text for _, text in phrases)
+    
+    def speech_to_text_from_bytes(self, data: bytes) -> Optional[str]:
+        """
+        Convierte audio en memoria (por ejemplo, la grabación WAV del chat) a texto
+        sin escribirlo en un archivo temporal. Usa reconocimiento continuo, así que
+        transcribe grabaciones de cualquier duración (no solo la primera frase).
+        
+        Args:
+            data: Bytes del audio. Si es WAV, se usa el formato de su cabecera;
+                  en otro caso se asume PCM 16 kHz, 16 bits, mono.
+        
+        Returns:
+            Texto transcrito o None si no se reconoció voz.
+        """
+        # Leer el formato de la cabecera WAV y enviar solo las muestras PCM
+        # (una vista sobre los bytes originales, sin copiarlas)
+        audio = memoryview(data)
+        stream_format = None
+        bytes_per_second = _PCM_BYTES_PER_SECOND
+        try:
+            wav_buffer = io.BytesIO(data)
+            with wave.open(wav_buffer, "rb") as wav_file:
+                stream_format = speechsdk.audio.AudioStreamFormat(
+                    samples_per_second=wav_file.getframerate(),
+                    bits_per_sample=wav_file.getsampwidth() * 8,
+                    channels=wav_file.getnchannels()
+                )
+                # Tras leer la cabecera, el buffer queda al inicio del chunk "data"
+                data_start = wav_buffer.tell()
+                data_size = wav_file.getnframes() * wav_file.getsampwidth() * wav_file.getnchannels()
+                audio = audio[data_start:data_start + data_size]
+                bytes_per_second = (
+                    wav_file.getframerate() * wav_file.getsampwidth() * wav_file.getnchannels()
+                ) or _PCM_BYTES_PER_SECOND
+        except (wave.Error, EOFError):
+            pass
+        
+        try:
+            callback = _BytesPullCallback(audio)
+            if stream_format is not None:
+                audio_stream = speechsdk.audio.PullAudioInputStream(callback, stream_format)
+            else:
+                audio_stream = speechsdk.audio.PullAudioInputStream(callback)
+            audio_config = speechsdk.audio.AudioConfig(stream=audio_stream)
+            phrases = self._recognize_continuous(audio_config, len(audio) / bytes_per_second)
+        except Exception as e:
+            raise Exception(f"Error al convertir voz a texto desde memoria: {str(e)}")
+        
+        if not phrases:
+            return None
+        return " ".join(text for _, text in phrases)
+    
+    def recognize_batch(self, audio_bufs: List[bytes]) -> List[Optional[str]]:
+        """
+        Convierte varios audios cortos a texto usando una sola sesión de
+        reconocimiento continuo (una conexión para todo el lote).
+        
+        Args:
+            audio_bufs: Audios en bytes (PCM 16 kHz, 16 bits, mono).
+        
+        Returns:
+            Lista con el texto transcrito de cada audio, en el mismo orden
+            (None si en ese audio no se reconoció voz).
+        """
+        if not audio_bufs:
+            return []
+        
+        # Inicio de cada audio en el stream (en segundos), contando los silencios intermedios
+        starts = []
+        position = 0
+        for audio_data in audio_bufs:
+            starts.append(position / _PCM_BYTES_PER_SECOND)
+            position += len(audio_data) + len(_BATCH_SILENCE)
+        
+        try:
+            push_stream = speechsdk.audio.PushAudioInputStream()
+            
+            def feed():
+                for audio_data in audio_bufs:
+                    push_stream.write(audio_data)
+                    push_stream.write(_BATCH_SILENCE)
+                push_stream.close()
+            
+            phrases = self._recognize_continuous(
+                speechsdk.audio.AudioConfig(stream=push_stream),
+                position / _PCM_BYTES_PER_SECOND,
+                feed=feed
             )
+        except Exception as e:
+            raise Exception(f"Error al convertir lote de audios a texto: {str(e)}")
+        
+        # Asignar cada frase al audio en el que empieza
+        texts: List[List[str]] = [[] for _ in audio_bufs]
+        for offset, text in phrases:
+            index = bisect_right(starts, offset) - 1
+            texts[max(index, 0)].append(text)
+        return [" ".join(parts) if parts else None for parts in texts]
+    
+    def _recognize_continuous(
+        self,
+        audio_config,
+        audio_seconds: float,
+        feed: Optional[Callable[[], None]] = None
+    ) -> List[Tuple[float, str]]:
+        """
+        Reconoce todas las frases de una entrada de audio con reconocimiento
+        continuo (sin el límite de duración de recognize_once).
+        
+        Args:
+            audio_config: Configuración de entrada de audio del SDK.
+            audio_seconds: Duración aproximada del audio, para el tiempo máximo de espera.
+            feed: Función que escribe el audio en el stream una vez iniciada la
+                  sesión (para entradas de tipo push). Opcional.
+        
+        Returns:
+            Lista de (inicio de la frase en segundos, texto reconocido), en orden.
+        
+        Raises:
+            Exception: Si el servicio cancela con error o no termina a tiempo.
+        """
+        phrases: List[Tuple[float, str]] = []
+        errors: List[str] = []
+        done = threading.Event()
+        
+        def on_recognized(evt):
+            if evt.result.reason == speechsdk.ResultReason.RecognizedSpeech and evt.result.text:
+                # El offset viene en unidades de 100 ns desde el inicio del audio
+                phrases.append((evt.result.offset / 10_000_000, evt.result.text))
+        
+        def on_canceled(evt):
+            details = evt.cancellation_details
+            if details.reason == speechsdk.CancellationReason.Error:
+                errors.append(f"{details.reason} - {details.error_details}")
+            done.set()
+        
+        speech_recognizer = speechsdk.SpeechRecognizer(
+            speech_config=self.speech_config,
+            audio_config=audio_config
+        )
+        speech_recognizer.recognized.connect(on_recognized)
+        speech_recognizer.canceled.connect(on_canceled)
+        speech_recognizer.session_stopped.connect(lambda evt: done.set())
+        
+        timeout = _RECOGNITION_TIMEOUT_BASE + _RECOGNITION_TIMEOUT_FACTOR * audio_seconds
+        try:
+            speech_recognizer.start_continuous_recognition_async().get()
+            if feed is not None:
+                feed()
             
-            result = speech_recognizer.recognize_once()
+            # Esperar a que el servicio procese todo el audio
+            if not done.wait(timeout=timeout):
+                raise Exception(
+                    f"El reconocimiento de voz no terminó en {timeout:.0f} segundos"
+                )
+        finally:
+            # Detener siempre la sesión, también si falla el inicio, feed() o la espera
+            speech_recognizer.stop_continuous_recognition_async().get()
+        
+        if errors:
+            raise Exception(f"Error en reconocimiento de voz: {errors[0]}")
+        return phrases
+    
+    def _acquire_synthesizer(self) -> speechsdk.SpeechSynthesizer:
+        """Toma un sintetizador libre, o crea uno si todos están en uso."""
+        with self._synthesizers_lock:
+            if self._idle_synthesizers:
+                return self._idle_synthesizers.pop()
+        return speechsdk.SpeechSynthesizer(
+            speech_config=self.speech_config,
+            audio_config=None
+        )
+    
+    def _release_synthesizer(self, synthesizer: speechsdk.SpeechSynthesizer):
+        """
+        Devuelve un sintetizador a la lista de libres para reutilizarlo. Si ya hay
+        _TTS_POOL_SIZE libres, se descarta para que su conexión se cierre.
+        """
+        with self._synthesizers_lock:
+            if len(self._idle_synthesizers) < _TTS_POOL_SIZE:
+                self._idle_synthesizers.append(synthesizer)
+    
+    def text_to_speech_stream(self, text: str, chunk_size: int = 4096) -> Generator[bytes, None, None]:
+        """
+        Convierte texto a audio y emite los bytes conforme el servicio los genera,
+        sin esperar a que termine la síntesis completa.
+        
+        Args:
+            text: Texto a convertir a voz.
+            chunk_size: Tamaño máximo de cada fragmento de audio en bytes.
+        
+        Yields:
+            Fragmentos de audio en bytes (formato Opus OGG).
+        """
+        synthesizer = self._acquire_synthesizer()
+        reusable = True
+        try:
+            result = synthesizer.start_speaking_text_async(text).get()
             
-            if result.reason == speechsdk.ResultReason.RecognizedSpeech:
-                return result.text
-            elif result.reason == speechsdk.ResultReason.NoMatch:
-                return None
-            else:
-                error_details = result.cancellation_details
-                if error_details:
-                    raise Exception(f"Error en reconocimiento de voz: {error_details.reason} - {error_details.error_details}")
-                return None
-                
+            if result.reason == speechsdk.ResultReason.Canceled:
+                cancellation_details = speechsdk.CancellationDetails(result)
+                raise Exception(
+                    f"Error en síntesis de voz: {cancellation_details.reason} - "
+                    f"{cancellation_details.error_details}"
+                )
+            
+            audio_stream = speechsdk.AudioDataStream(result)
+            buffer = bytes(chunk_size)
+            while True:
+                filled = audio_stream.read_data(buffer)
+                if filled == 0:
+                    break
+                yield buffer[:filled]
+            
+            if audio_stream.status == speechsdk.StreamStatus.Canceled:
+                cancellation_details = audio_stream.cancellation_details
+                raise Exception(
+                    f"Error en síntesis de voz: {cancellation_details.reason} - "
+                    f"{cancellation_details.error_details}"
+                )
+            
+        except GeneratorExit:
+            # El consumidor dejó de leer a medias: detener la síntesis en curso para que
+            # el servicio no siga generando audio y el sintetizador quede libre. Si no se
+            # puede detener, no se reutiliza (seguiría ocupado con el resto de la síntesis)
+            try:
+                synthesizer.stop_speaking_async().get()
+            except Exception:
+                reusable = False
+            raise
         except Exception as e:
-            raise Exception(f"Error al convertir voz a texto desde archivo: {str(e)}")
+            raise Exception(f"Error al convertir texto a voz: {str(e)}")
+        finally:
+            if reusable:
+                self._release_synthesizer(synthesizer)
     
     def text_to_speech(self, text: str) -> bytes:
         """
@@ -122,25 +451,23 @@ class AzureSpeechClient:
             text: Texto a convertir a voz.
         
         Returns:
-            Datos de audio en bytes (formato WAV).
+            Datos de audio en bytes (formato Opus OGG).
         """
+        key = self._tts_cache_key(text)
+        audio_data = self._tts_cache_get(key)
+        if audio_data is None:
+            audio_data = self._tts_flight.do(key, lambda: self._synthesize_and_store(key, text))
+        return audio_data
+    
+    def _synthesize_and_store(self, key: str, text: str) -> bytes:
+        """Sintetiza un texto completo con un sintetizador libre y lo guarda en la cache."""
+        synthesizer = self._acquire_synthesizer()
         try:
-            # Configurar formato de audio (WAV 16kHz mono)
-            self.speech_config.set_speech_synthesis_output_format(
-                speechsdk.SpeechSynthesisOutputFormat.Audio16Khz128KBitRateMonoMp3
-            )
-            
-            # Crear sintetizador de voz sin configuración de salida (genera en memoria)
-            synthesizer = speechsdk.SpeechSynthesizer(
-                speech_config=self.speech_config,
-                audio_config=None
-            )
-            
-            # Sintetizar voz
             result = synthesizer.speak_text_async(text).get()
             
+            # Solo un audio completo se devuelve (y se guarda en la cache)
             if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
-                return result.audio_data
+                audio_data = result.audio_data
             elif result.reason == speechsdk.ResultReason.Canceled:
                 cancellation_details = speechsdk.CancellationDetails(result)
                 raise Exception(
@@ -152,36 +479,188 @@ class AzureSpeechClient:
                 
         except Exception as e:
             raise Exception(f"Error al convertir texto a voz: {str(e)}")
+        finally:
+            self._release_synthesizer(synthesizer)
+        
+        self._tts_cache_put(key, audio_data)
+        return audio_data
+    
+    async def text_to_speech_async(self, text: str) -> bytes:
+        """
+        Versión asíncrona de text_to_speech: la síntesis se ejecuta en el pool de TTS
+        sin bloquear el event loop, de modo que varias solicitudes se sintetizan en paralelo.
+        
+        Args:
+            text: Texto a convertir a voz.
+        
+        Returns:
+            Datos de audio en bytes (formato Opus OGG).
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._tts_pool, self.text_to_speech, text)
+    
+    def _tts_cache_key(self, text: str) -> str:
+        """Clave de cache para un texto con la voz y el formato actuales."""
+        voice = self.speech_config.speech_synthesis_voice_name
+        raw_key = f"{voice}|{_TTS_OUTPUT_FORMAT.name}|{text}"
+        return hashlib.blake2b(raw_key.encode("utf-8"), digest_size=16).hexdigest()
+    
+    def _tts_cache_get(self, key: str) -> Optional[bytes]:
+        """Busca un audio en la cache: primero en memoria y luego en disco."""
+        now = time.time()
+        
+        with self._tts_cache_lock:
+            entry = self._tts_cache.get(key)
+            if entry is not None:
+                created_at, audio_data = entry
+                if self._tts_ttl is None or now - created_at <= self._tts_ttl:
+                    self._tts_cache.move_to_end(key)
+                    return audio_data
+                del self._tts_cache[key]
+        
+        if self._tts_cache_dir is None:
+            return None
+        
+        cache_path = self._tts_cache_dir / (key + _TTS_FILE_EXT)
+        try:
+            created_at = cache_path.stat().st_mtime
+            if self._tts_ttl is not None and now - created_at > self._tts_ttl:
+                cache_path.unlink(missing_ok=True)
+                return None
+            audio_data = cache_path.read_bytes()
+        except OSError:
+            return None
+        
+        self._tts_cache_remember(key, created_at, audio_data)
+        return audio_data
+    
+    def _tts_cache_put(self, key: str, audio_data: bytes):
+        """Guarda un audio en la cache en memoria y, si está configurada, en disco."""
+        self._tts_cache_remember(key, time.time(), audio_data)
+        
+        if self._tts_cache_dir is None:
+            return
+        
+        # Escritura atómica: archivo temporal en el mismo directorio + os.replace
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self._tts_cache_dir, suffix=".tmp")
+        except OSError:
+            # La cache en disco es opcional: si falla, seguir solo con memoria
+            return
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                tmp_file.write(audio_data)
+            os.replace(tmp_path, self._tts_cache_dir / (key + _TTS_FILE_EXT))
+        except OSError:
+            # Por ejemplo, disco lleno: no dejar el archivo temporal a medias
+            self._tts_disk_unlink(Path(tmp_path))
+            return
+        
+        with self._tts_disk_lock:
+            self._tts_disk_bytes += len(audio_data)
+            over_limit = self._tts_disk_bytes > self._tts_disk_max_bytes
+        if over_limit:
+            try:
+                self._tts_disk_prune()
+            except OSError:
+                pass
+    
+    @staticmethod
+    def _tts_disk_unlink(cache_path: Path) -> bool:
+        """Borra un archivo de la cache en disco; devuelve False si no se pudo borrar."""
+        try:
+            cache_path.unlink(missing_ok=True)
+        except OSError:
+            return False
+        return True
+    
+    def _tts_disk_prune(self):
+        """
+        Borra de la cache en disco los archivos temporales abandonados, los audios
+        caducados y, si se supera el tamaño máximo, los más antiguos hasta quedar por
+        debajo del 90% del límite. Los archivos que no se pueden borrar se mantienen.
+        """
+        now = time.time()
+        for tmp_path in self._tts_cache_dir.glob("*.tmp"):
+            try:
+                if now - tmp_path.stat().st_mtime > _TTS_TMP_MAX_AGE:
+                    self._tts_disk_unlink(tmp_path)
+            except OSError:
+                continue
+        
+        entries = []
+        for cache_path in self._tts_cache_dir.glob("*" + _TTS_FILE_EXT):
+            try:
+                stat = cache_path.stat()
+            except OSError:
+                continue
+            if self._tts_ttl is not None and now - stat.st_mtime > self._tts_ttl:
+                if self._tts_disk_unlink(cache_path):
+                    continue
+            entries.append((stat.st_mtime, stat.st_size, cache_path))
+        
+        total_bytes = sum(size for _, size, _ in entries)
+        if total_bytes > self._tts_disk_max_bytes:
+            target_bytes = self._tts_disk_max_bytes * 0.9
+            for _, size, cache_path in sorted(entries, key=lambda entry: entry[0]):
+                if total_bytes <= target_bytes:
+                    break
+                if self._tts_disk_unlink(cache_path):
+                    total_bytes -= size
+        
+        with self._tts_disk_lock:
+            self._tts_disk_bytes = total_bytes
+    
+    def _tts_cache_remember(self, key: str, created_at: float, audio_data: bytes):
+        """Inserta un audio en la LRU en memoria, descartando el más antiguo si está llena."""
+        with self._tts_cache_lock:
+            self._tts_cache[key] = (created_at, audio_data)
+            self._tts_cache.move_to_end(key)
+            while len(self._tts_cache) > self._tts_cache_size:
+                self._tts_cache.popitem(last=False)
     
     def text_to_speech_to_file(self, text: str, output_file_path: str) -> bool:
         """
         Convierte texto a audio y lo guarda en un archivo.
         
+        Usa la síntesis en memoria (sintetizadores persistentes y cache de TTS) y
+        escribe los bytes resultantes en el archivo.
+        
         Args:
             text: Texto a convertir a voz.
-            output_file_path: Ruta donde guardar el archivo de audio.
+            output_file_path: Ruta donde guardar el archivo de audio (formato Opus OGG).
         
         Returns:
             True si se guardó correctamente, False en caso contrario.
         """
         try:
-            audio_config = speechsdk.audio.AudioOutputConfig(filename=output_file_path)
-            synthesizer = speechsdk.SpeechSynthesizer(
-                speech_config=self.speech_config,
-                audio_config=audio_config
-            )
-            
-            result = synthesizer.speak_text_async(text).get()
-            
-            if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
-                return True
-            elif result.reason == speechsdk.ResultReason.Canceled:
-                cancellation_details = speechsdk.CancellationDetails(result)
-                raise Exception(
-                    f"Error en síntesis de voz: {cancellation_details.reason} - "
-                    f"{cancellation_details.error_details}"
-                )
-            return False
+            audio_data = self.text_to_speech(text)
+            if not audio_data:
+                return False
+            Path(output_file_path).write_bytes(audio_data)
+            return True
+                
+        except Exception as e:
+            raise Exception(f"Error al convertir texto a voz y guardar archivo: {str(e)}")
+    
+    async def text_to_speech_to_file_async(self, text: str, output_file_path: str) -> bool:
+        """
+        Versión asíncrona de text_to_speech_to_file: la síntesis se ejecuta en el
+        pool de TTS y la escritura del archivo en un hilo, sin bloquear el event loop.
+        
+        Args:
+            text: Texto a convertir a voz.
+            output_file_path: Ruta donde guardar el archivo de audio (formato Opus OGG).
+        
+        Returns:
+            True si se guardó correctamente, False en caso contrario.
+        """
+        try:
+            audio_data = await self.text_to_speech_async(text)
+            if not audio_data:
+                return False
+            await asyncio.to_thread(Path(output_file_path).write_bytes, audio_data)
+            return True
                 
         except Exception as e:
             raise Exception(f"Error al convertir texto a voz y guardar archivo: {str(e)}")
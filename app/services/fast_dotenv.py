@@ -0,0 +1,44 @@
+"""
+Cargador mínimo de archivos .env (reemplazo ligero de python-dotenv).
+
+Formato soportado: líneas CLAVE=valor, con prefijo opcional "export ", valores
+opcionalmente entre comillas simples o dobles y comentarios con "#" (líneas
+completas o al final de la línea, precedidos de un espacio). No se soportan
+valores multilínea, secuencias de escape ni expansión de variables (${VAR}).
+"""
+import os
+import re
+
+# Líneas del tipo [export ]CLAVE=valor; [ \t] (y no \s) para que una coincidencia
+# nunca cruce a la línea siguiente cuando el valor está vacío
+_ENV_LINE_RE = re.compile(
+    r"^[ \t]*(?:export[ \t]+)?([A-Za-z_][A-Za-z0-9_]*)[ \t]*=[ \t]*(.*?)[ \t\r]*$",
+    re.M
+)
+# Valor entre comillas, seguido opcionalmente de un comentario
+_QUOTED_VALUE_RE = re.compile(r"""^(["'])(.*?)\1(?:[ \t]+#.*)?$""")
+# Comentario al final de un valor sin comillas
+_INLINE_COMMENT_RE = re.compile(r"[ \t]+#.*$")
+
+
+def fast_load(path: str = ".env") -> None:
+    """
+    Carga las variables de un archivo .env en os.environ.
+    
+    Las variables ya definidas en el entorno no se sobrescriben, igual que
+    el comportamiento por defecto de python-dotenv.
+    
+    Args:
+        path: Ruta al archivo .env.
+    """
+    with open(path, "rb") as env_file:
+        text = env_file.read().decode("utf-8-sig")
+    
+    for key, value in _ENV_LINE_RE.findall(text):
+        quoted = _QUOTED_VALUE_RE.match(value)
+        if quoted:
+            # Quitar comillas envolventes (el "#" dentro de las comillas es parte del valor)
+            value = quoted.group(2)
+        else:
+            value = _INLINE_COMMENT_RE.sub("", value)
+        os.environ.setdefault(key, value)
@@ -2,11 +2,39 @@
 Pipeline RAG (Retrieval Augmented Generation) que orquesta la búsqueda
 y generación de respuestas.
 """
-from typing import Dict, List, Optional, Generator
-from app.services.azure_search_client import AzureSearchClient
-from app.services.azure_openai_client import AzureOpenAIClient
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, List, Optional, Generator, Tuple
+from app.services.azure_search_client import AzureSearchClient, SearchHit
+from app.services.azure_openai_client import AzureOpenAIClient, RateLimitError
+from app.services.single_flight import SingleFlight
 from app.config import AzureSearchConfig, AzureOpenAIConfig
 
+if TYPE_CHECKING:
+    import httpx
+    from app.services.semantic_cache import SemanticCache
+
+
+# Límites de contexto para evitar exceder el límite de tokens
+MAX_CHARS_PER_CHUNK = 4000  # Máximo de caracteres por chunk
+MAX_TOTAL_CONTEXT = 12000   # Máximo total de caracteres en el contexto
+
+NO_RESULTS_MESSAGE = (
+    "No se encontró información relevante en los manuales para responder tu pregunta. "
+    "Por favor, intenta reformularla o usar términos más específicos."
+)
+
+# Plantillas de los mensajes de error mostrados al usuario (se rellenan con el error original)
+RATE_LIMIT_MESSAGE_TEMPLATE = (
+    "⚠️ **Límite de tasa alcanzado**\n\n%s\n\n"
+    "Por favor, espera un momento antes de hacer otra pregunta."
+)
+ERROR_MESSAGE_TEMPLATE = (
+    "❌ **Error al procesar tu pregunta**\n\n%s\n\n"
+    "Por favor, intenta de nuevo o verifica tu configuración de Azure."
+)
+
 
 class RAGPipeline:
     """Pipeline que implementa el patrón RAG completo."""
@@ -14,7 +42,10 @@ class RAGPipeline:
     def __init__(
         self,
         search_config: AzureSearchConfig,
-        openai_config: AzureOpenAIConfig
+        openai_config: AzureOpenAIConfig,
+        http_client: Optional["httpx.Client"] = None,
+        async_http_client: Optional["httpx.AsyncClient"] = None,
+        loop: Optional[asyncio.AbstractEventLoop] = None
     ):
         """
         Inicializa el pipeline RAG con los clientes necesarios.
@@ -22,9 +53,40 @@ class RAGPipeline:
         Args:
             search_config: Configuración de Azure AI Search.
             openai_config: Configuración de Azure OpenAI.
+            http_client: Cliente HTTP compartido por ambos clientes de Azure.
+            async_http_client: Cliente HTTP asíncrono compartido por ambos clientes de Azure.
+            loop: Event loop en segundo plano donde se ejecutan las llamadas asíncronas.
         """
-        self.search_client = AzureSearchClient(search_config)
-        self.openai_client = AzureOpenAIClient(openai_config)
+        self.loop = loop
+        self.search_client = AzureSearchClient(
+            search_config,
+            http_client=http_client,
+            async_http_client=async_http_client,
+            loop=loop
+        )
+        self.openai_client = AzureOpenAIClient(
+            openai_config,
+            http_client=http_client,
+            async_http_client=async_http_client
+        )
+        
+        # Cache semántica de rag_answer (solo si hay deployment de embeddings)
+        # Una cache por (top_k, temperature), la misma regla que la clave de
+        # _answer_flight: la búsqueda por similitud solo compara respuestas generadas
+        # con los mismos parámetros. None si no hay embeddings (semantic_cache importa
+        # NumPy, así que solo se carga si se va a usar)
+        self._qcaches: Optional[Dict[Tuple[int, float], "SemanticCache"]] = (
+            {} if openai_config.embedding_deployment else None
+        )
+        # Hilos para calcular el embedding de la pregunta mientras se busca en Azure AI Search
+        self._embed_pool: Optional[ThreadPoolExecutor] = (
+            ThreadPoolExecutor(max_workers=4, thread_name_prefix="rag-embed")
+            if openai_config.embedding_deployment else None
+        )
+        
+        # rag_answer en curso por pregunta normalizada: preguntas idénticas concurrentes
+        # comparten una sola búsqueda y generación
+        self._answer_flight = SingleFlight()
         
         # Prompt del sistema para el modelo
         self.system_prompt = """Eres un asistente especializado para field engineers de dispositivos biomédicos. 
@@ -38,6 +100,182 @@ INSTRUCCIONES:
 - Si mencionas procedimientos, sé específico sobre los pasos.
 - Si hay información sobre modelos o números de parte, inclúyela en tu respuesta.
 - Solo di "No encontré información suficiente" si realmente no hay NADA relacionado con la pregunta en el contexto."""
+        
+        # Mensaje de sistema precalculado y compartido por todas las llamadas: el prefijo
+        # del prompt es idéntico entre consultas (reutilizable por la cache del servidor)
+        self._pre_messages = [{"role": "system", "content": self.system_prompt}]
+    
+    @staticmethod
+    def _build_context_and_sources(search_results: List[SearchHit]) -> Tuple[List[str], List[Dict]]:
+        """
+        Extrae y limita los fragmentos de texto (campo "content") y prepara la
+        información de fuentes en una sola pasada, descartando resultados repetidos.
+        
+        Args:
+            search_results: Documentos devueltos por Azure AI Search.
+        
+        Returns:
+            Tupla (fragmentos de contexto dentro de los límites de tamaño,
+            lista de fuentes con "source", "score" y "path").
+        """
+        half = MAX_CHARS_PER_CHUNK // 2
+        seen = set()
+        context_chunks = []
+        sources = []
+        total_length = 0
+        context_full = False
+        
+        for doc in search_results:
+            content = doc.content
+            
+            # Descartar resultados con el mismo texto completo (sin contar espacios);
+            # páginas distintas con el mismo encabezado se conservan
+            if content:
+                fingerprint = " ".join(content.split())
+                if fingerprint in seen:
+                    continue
+                seen.add(fingerprint)
+            
+            # Los resultados ya vienen con el campo "source" mapeado desde metadata_storage_name
+            sources.append({
+                "source": doc.source,  # Nombre del PDF
+                "score": doc.score,  # Score de relevancia
+                "path": doc.path  # Ruta del documento, para depuración
+            })
+            
+            if not content or context_full:
+                continue
+            
+            if len(content) > MAX_CHARS_PER_CHUNK:
+                # Truncar desde el medio, manteniendo inicio y final
+                content = content[:half] + "... [texto truncado] ..." + content[-half:]
+            
+            # Quedarse con los chunks cuya suma acumulada cabe en el límite total
+            total_length += len(content)
+            if total_length <= MAX_TOTAL_CONTEXT:
+                context_chunks.append(content)
+            else:
+                context_full = True
+                if not context_chunks:
+                    # Si el primer chunk ya excede el límite total, truncarlo más
+                    context_chunks.append(content[:MAX_TOTAL_CONTEXT] + "... [texto truncado]")
+        
+        return context_chunks, sources
+    
+    @staticmethod
+    def _no_context_message(search_results: List[SearchHit]) -> str:
+        """Mensaje cuando hay resultados pero ninguno tiene texto útil."""
+        # Debug: mostrar qué se encontró pero no se pudo procesar
+        debug_info = f"Se encontraron {len(search_results)} documentos pero no contenían texto útil."
+        if search_results:
+            debug_info += f" Scores: {[doc.score for doc in search_results[:3]]}"
+        return f"{debug_info} Por favor, intenta otra pregunta o reformula con términos más específicos."
+    
+    @staticmethod
+    def _error_message(error: Exception) -> str:
+        """Mensaje de error para el usuario a partir del error original."""
+        # El límite de tasa ya trae un mensaje claro para el usuario: usarlo directamente
+        if isinstance(error, RateLimitError):
+            return RATE_LIMIT_MESSAGE_TEMPLATE % error
+        
+        # Otros errores
+        return ERROR_MESSAGE_TEMPLATE % error
+    
+    def _embed_question(self, user_question: str) -> Optional[List[float]]:
+        """Embedding de la pregunta para la cache semántica, o None si no está disponible."""
+        if self._qcaches is None:
+            return None
+        try:
+            return self.openai_client.embed(user_question)
+        except Exception:
+            # La cache es una optimización: si falla el embedding, seguir sin ella
+            return None
+    
+    def _cache_lookup(
+        self,
+        question_embedding: Optional[List[float]],
+        top_k: int,
+        temperature: float,
+        search_results: List[SearchHit]
+    ) -> Optional[Dict]:
+        """
+        Busca en la cache semántica una respuesta generada con el mismo top_k y temperature.
+        
+        Solo se acepta el acierto si alguna de sus fuentes está entre los resultados
+        de la búsqueda actual: preguntas casi idénticas sobre otro modelo o número de
+        parte recuperan otros documentos y no deben recibir la respuesta cacheada.
+        
+        Returns:
+            Copia de la respuesta cacheada, o None si no hay un acierto válido.
+        """
+        if question_embedding is None:
+            return None
+        qcache = self._qcaches.get((top_k, temperature))
+        if qcache is None:
+            return None
+        cached = qcache.lookup(question_embedding)
+        if cached is None:
+            return None
+        
+        current_paths = {doc.path for doc in search_results if doc.path}
+        if not any(source["path"] in current_paths for source in cached["sources"]):
+            return None
+        return self._copy_result(cached)
+    
+    @staticmethod
+    def _copy_result(result: Dict) -> Dict:
+        """Copia una respuesta para que la cache y los llamadores no compartan objetos."""
+        return {
+            "answer": result["answer"],
+            "sources": [dict(source) for source in result["sources"]]
+        }
+    
+    def _cache_store(
+        self,
+        question_embedding: Optional[List[float]],
+        top_k: int,
+        temperature: float,
+        result: Dict
+    ):
+        """Guarda una respuesta en la cache semántica de su (top_k, temperature)."""
+        if question_embedding is None:
+            return
+        qcache = self._qcaches.get((top_k, temperature))
+        if qcache is None:
+            from app.services.semantic_cache import SemanticCache
+            qcache = self._qcaches.setdefault((top_k, temperature), SemanticCache())
+        qcache.add(question_embedding, self._copy_result(result))
+    
+    def warmup(self) -> threading.Thread:
+        """
+        Abre en segundo plano las conexiones con Azure AI Search y Azure OpenAI
+        (TCP + TLS) con una búsqueda mínima y una generación de 1 token, para que
+        la primera pregunta del usuario no pague ese coste.
+        
+        Returns:
+            Hilo en el que se ejecuta el calentamiento.
+        """
+        def _run():
+            # Los errores se ignoran: el calentamiento es solo una optimización
+            try:
+                self.search_client.search_documents_text_only(query="warmup", top_k=1)
+            except Exception:
+                pass
+            try:
+                self.openai_client.prepare_tokenizer()
+                self.openai_client.generate_response(
+                    system_prompt=self.system_prompt,
+                    pre_messages=self._pre_messages,
+                    user_message="warmup",
+                    context_chunks=[],
+                    max_tokens=1
+                )
+            except Exception:
+                pass
+        
+        thread = threading.Thread(target=_run, name="rag-warmup", daemon=True)
+        thread.start()
+        return thread
     
     def rag_answer(
         self,
@@ -59,113 +297,143 @@ INSTRUCCIONES:
                 - "sources": lista de fuentes usadas (cada fuente es un dict con
                             "source", "pageNumber", "score", etc.).
         """
+        normalized_question = " ".join(user_question.lower().split())
+        key = f"{top_k}|{temperature}|{normalized_question}"
+        # Los llamadores concurrentes comparten el resultado: cada uno recibe su copia
+        return self._copy_result(self._answer_flight.do(
+            key,
+            lambda: self._rag_answer(user_question, top_k, temperature)
+        ))
+    
+    def _rag_answer(self, user_question: str, top_k: int, temperature: float) -> Dict:
+        """Implementación de rag_answer (sin deduplicación de llamadas concurrentes)."""
         try:
-            # Paso 1: Buscar documentos relevantes en Azure AI Search
+            # Pasos 0 y 1 en paralelo: embedding para la cache semántica (en otro hilo)
+            # + búsqueda de documentos relevantes en Azure AI Search
+            embed_future = (
+                self._embed_pool.submit(self._embed_question, user_question)
+                if self._embed_pool is not None else None
+            )
             search_results = self.search_client.search_documents_text_only(
                 query=user_question,
                 top_k=top_k
             )
             
+            # Si hay una respuesta ya generada para una pregunta equivalente y sus
+            # fuentes siguen entre los resultados, usarla (se evita la generación)
+            question_embedding = embed_future.result() if embed_future is not None else None
+            cached = self._cache_lookup(question_embedding, top_k, temperature, search_results)
+            if cached is not None:
+                return cached
+            
             # Paso 2: Validar que se encontraron resultados
-            if not search_results or len(search_results) == 0:
+            if not search_results:
                 return {
-                    "answer": "No se encontró información relevante en los manuales para responder tu pregunta. Por favor, intenta reformularla o usar términos más específicos.",
+                    "answer": NO_RESULTS_MESSAGE,
                     "sources": []
                 }
             
-            # Paso 3: Extraer y limitar fragmentos de texto (campo "content")
-            # Aplicar límites para evitar exceder el límite de tokens
-            MAX_CHARS_PER_CHUNK = 4000  # Máximo de caracteres por chunk (aumentado)
-            MAX_TOTAL_CONTEXT = 12000   # Máximo total de caracteres en el contexto (aumentado significativamente)
-            
-            context_chunks = []
-            total_chars = 0
-            
-            for doc in search_results:
-                content = doc.get("content", "")
-                if not content:
-                    continue
-                
-                # Truncar chunks muy largos de forma inteligente
-                # Mantener el inicio y el final del chunk si es posible
-                if len(content) > MAX_CHARS_PER_CHUNK:
-                    # Truncar desde el medio, manteniendo inicio y final
-                    half = MAX_CHARS_PER_CHUNK // 2
-                    content = content[:half] + "... [texto truncado] ..." + content[-half:]
-                
-                # Verificar si añadir este chunk excedería el límite total
-                chunk_size = len(content)
-                if total_chars + chunk_size > MAX_TOTAL_CONTEXT:
-                    # Si ya tenemos al menos un chunk, parar aquí
-                    if context_chunks:
-                        break
-                    # Si es el primer chunk y es muy grande, truncarlo más
-                    content = content[:MAX_TOTAL_CONTEXT] + "... [texto truncado]"
-                    context_chunks.append(content)
-                    break
-                
-                context_chunks.append(content)
-                total_chars += chunk_size
+            # Paso 3: Extraer y limitar fragmentos de texto (campo "content") y preparar las fuentes
+            context_chunks, sources = self._build_context_and_sources(search_results)
             
             if not context_chunks:
-                # Debug: mostrar qué se encontró pero no se pudo procesar
-                debug_info = f"Se encontraron {len(search_results)} documentos pero no contenían texto útil."
-                if search_results:
-                    debug_info += f" Scores: {[doc.get('score', 0) for doc in search_results[:3]]}"
                 return {
-                    "answer": f"{debug_info} Por favor, intenta otra pregunta o reformula con términos más específicos.",
+                    "answer": self._no_context_message(search_results),
                     "sources": []
                 }
             
             # Paso 4: Generar respuesta usando Azure OpenAI con el contexto
             answer = self.openai_client.generate_response(
                 system_prompt=self.system_prompt,
+                pre_messages=self._pre_messages,
                 user_message=user_question,
                 context_chunks=context_chunks,
                 temperature=temperature
             )
             
-            # Paso 5: Preparar información de fuentes
-            # Los resultados ya vienen con el campo "source" mapeado desde metadata_storage_name
-            sources = []
-            for doc in search_results:
-                source_info = {
-                    "source": doc.get("source", "Unknown"),  # Nombre del PDF
-                    "score": doc.get("score", 0.0)  # Score de relevancia
-                }
-                # Opcional: incluir path para depuración si es necesario
-                if "path" in doc:
-                    source_info["path"] = doc["path"]
-                
-                sources.append(source_info)
-            
-            return {
+            result = {
                 "answer": answer,
                 "sources": sources
             }
             
+            # Guardar la respuesta en la cache semántica
+            self._cache_store(question_embedding, top_k, temperature, result)
+            
+            return result
+            
         except Exception as e:
-            # Manejo de errores con mensajes más específicos
-            error_message = str(e)
+            return {"answer": self._error_message(e), "sources": []}
+    
+    async def rag_answer_async(
+        self,
+        user_question: str,
+        top_k: int = 5,
+        temperature: float = 1.0
+    ) -> Dict:
+        """
+        Versión asíncrona de rag_answer: la búsqueda y el embedding de la pregunta
+        se ejecutan en paralelo.
+        
+        Debe ejecutarse en el loop en segundo plano del pipeline (self.loop), donde
+        viven las conexiones de los clientes asíncronos; desde código síncrono usa
+        asyncio.run_coroutine_threadsafe(pipeline.rag_answer_async(...), pipeline.loop).
+        
+        Args:
+            user_question: Pregunta del usuario.
+            top_k: Número de documentos a recuperar de Azure Search.
+            temperature: Temperatura para la generación del modelo.
+        
+        Returns:
+            Diccionario con "answer" y "sources" (igual que rag_answer).
+        """
+        try:
+            # Pasos 0 y 1 en paralelo: embedding para la cache semántica + búsqueda
+            search_results, question_embedding = await asyncio.gather(
+                self.search_client.asearch_documents(query=user_question, top_k=top_k),
+                asyncio.to_thread(self._embed_question, user_question)
+            )
             
-            # Si el error ya tiene un mensaje claro (como rate limit), usarlo directamente
-            if "Límite de tasa alcanzado" in error_message or "rate limit" in error_message.lower():
+            cached = self._cache_lookup(question_embedding, top_k, temperature, search_results)
+            if cached is not None:
+                return cached
+            
+            # Paso 2: Validar que se encontraron resultados
+            if not search_results:
+                return {"answer": NO_RESULTS_MESSAGE, "sources": []}
+            
+            # Paso 3: Extraer y limitar fragmentos de texto y preparar las fuentes
+            context_chunks, sources = self._build_context_and_sources(search_results)
+            if not context_chunks:
                 return {
-                    "answer": f"⚠️ **Límite de tasa alcanzado**\n\n{error_message}\n\nPor favor, espera un momento antes de hacer otra pregunta.",
+                    "answer": self._no_context_message(search_results),
                     "sources": []
                 }
             
-            # Otros errores
-            return {
-                "answer": f"❌ **Error al procesar tu pregunta**\n\n{error_message}\n\nPor favor, intenta de nuevo o verifica tu configuración de Azure.",
-                "sources": []
+            # Paso 4: Generar respuesta
+            answer = await self.openai_client.agenerate_response(
+                system_prompt=self.system_prompt,
+                pre_messages=self._pre_messages,
+                user_message=user_question,
+                context_chunks=context_chunks,
+                temperature=temperature
+            )
+            
+            result = {
+                "answer": answer,
+                "sources": sources
             }
+            self._cache_store(question_embedding, top_k, temperature, result)
+            return result
+            
+        except Exception as e:
+            return {"answer": self._error_message(e), "sources": []}
     
     def rag_answer_stream(
         self,
         user_question: str,
         top_k: int = 5,
-        temperature: float = 1.0
+        temperature: float = 1.0,
+        search_results: Optional[List[SearchHit]] = None
     ) -> Generator[str, None, Dict]:
         """
         Ejecuta el pipeline RAG con streaming: búsqueda + generación de respuesta en tiempo real.
@@ -174,88 +442,49 @@ INSTRUCCIONES:
             user_question: Pregunta del usuario.
             top_k: Número de documentos a recuperar de Azure Search.
             temperature: Temperatura para la generación del modelo.
+            search_results: Resultados de búsqueda ya obtenidos (por ejemplo, desde
+                           una cache). Si es None, se busca en Azure AI Search.
         
         Yields:
             Fragmentos de texto de la respuesta conforme se generan.
         
         Returns:
-            Diccionario con "sources" al finalizar.
+            Diccionario con "sources" al finalizar (valor de StopIteration; la UI
+            lo usa para mostrar las fuentes sin repetir la búsqueda).
         """
         try:
             # Paso 1: Buscar documentos relevantes en Azure AI Search
-            search_results = self.search_client.search_documents_text_only(
-                query=user_question,
-                top_k=top_k
-            )
+            if search_results is None:
+                search_results = self.search_client.search_documents_text_only(
+                    query=user_question,
+                    top_k=top_k
+                )
             
             # Paso 2: Validar que se encontraron resultados
-            if not search_results or len(search_results) == 0:
-                yield "No se encontró información relevante en los manuales para responder tu pregunta. Por favor, intenta reformularla o usar términos más específicos."
+            if not search_results:
+                yield NO_RESULTS_MESSAGE
                 return {"sources": []}
             
-            # Paso 3: Extraer y limitar fragmentos de texto
-            MAX_CHARS_PER_CHUNK = 4000
-            MAX_TOTAL_CONTEXT = 12000
-            
-            context_chunks = []
-            total_chars = 0
-            
-            for doc in search_results:
-                content = doc.get("content", "")
-                if not content:
-                    continue
-                
-                if len(content) > MAX_CHARS_PER_CHUNK:
-                    half = MAX_CHARS_PER_CHUNK // 2
-                    content = content[:half] + "... [texto truncado] ..." + content[-half:]
-                
-                chunk_size = len(content)
-                if total_chars + chunk_size > MAX_TOTAL_CONTEXT:
-                    if context_chunks:
-                        break
-                    content = content[:MAX_TOTAL_CONTEXT] + "... [texto truncado]"
-                    context_chunks.append(content)
-                    break
-                
-                context_chunks.append(content)
-                total_chars += chunk_size
+            # Paso 3: Extraer y limitar fragmentos de texto y preparar las fuentes
+            context_chunks, sources = self._build_context_and_sources(search_results)
             
             if not context_chunks:
-                debug_info = f"Se encontraron {len(search_results)} documentos pero no contenían texto útil."
-                if search_results:
-                    debug_info += f" Scores: {[doc.get('score', 0) for doc in search_results[:3]]}"
-                yield f"{debug_info} Por favor, intenta otra pregunta o reformula con términos más específicos."
+                yield self._no_context_message(search_results)
                 return {"sources": []}
             
             # Paso 4: Generar respuesta con streaming
-            full_answer = ""
             for chunk in self.openai_client.generate_response_stream(
                 system_prompt=self.system_prompt,
+                pre_messages=self._pre_messages,
                 user_message=user_question,
                 context_chunks=context_chunks,
                 temperature=temperature
             ):
-                full_answer += chunk
                 yield chunk
             
-            # Paso 5: Preparar información de fuentes
-            sources = []
-            for doc in search_results:
-                source_info = {
-                    "source": doc.get("source", "Unknown"),
-                    "score": doc.get("score", 0.0)
-                }
-                if "path" in doc:
-                    source_info["path"] = doc["path"]
-                sources.append(source_info)
-            
             return {"sources": sources}
             
         except Exception as e:
-            error_message = str(e)
-            if "Límite de tasa alcanzado" in error_message or "rate limit" in error_message.lower():
-                yield f"⚠️ **Límite de tasa alcanzado**\n\n{error_message}\n\nPor favor, espera un momento antes de hacer otra pregunta."
-            else:
-                yield f"❌ **Error al procesar tu pregunta**\n\n{error_message}\n\nPor favor, intenta de nuevo o verifica tu configuración de Azure."
+            yield self._error_message(e)
             return {"sources": []}
 
@@ -0,0 +1,91 @@
+"""
+Cache semántica de respuestas RAG basada en similitud de embeddings.
+"""
+import threading
+from typing import Any, List, Optional
+
+import numpy as np
+
+
+class SemanticCache:
+    """
+    Guarda respuestas indexadas por el embedding de la pregunta y devuelve la
+    respuesta de la pregunta más parecida si supera un umbral de similitud coseno.
+    """
+    
+    def __init__(self, threshold: float = 0.93, max_entries: int = 1024):
+        """
+        Inicializa la cache semántica.
+        
+        Args:
+            threshold: Similitud coseno mínima para considerar un acierto.
+            max_entries: Número máximo de entradas; al superarlo se descarta la
+                         menos usada recientemente.
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        
+        # Matriz (max_entries, d) de embeddings normalizados; se reserva con la primera inserción
+        self._embeddings: Optional[np.ndarray] = None
+        self._values: List[Any] = []
+        self._last_used = np.zeros(max_entries, dtype=np.int64)
+        self._clock = 0
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        """Convierte el embedding a vector float32 de norma 1."""
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+    
+    def lookup(self, embedding: List[float]) -> Optional[Any]:
+        """
+        Busca la entrada más parecida al embedding dado.
+        
+        Args:
+            embedding: Embedding de la pregunta.
+        
+        Returns:
+            El valor cacheado si la similitud supera el umbral, o None.
+        """
+        query = self._normalize(embedding)
+        with self._lock:
+            size = len(self._values)
+            if size == 0:
+                return None
+            
+            scores = self._embeddings[:size] @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return None
+            
+            self._clock += 1
+            self._last_used[best] = self._clock
+            return self._values[best]
+    
+    def add(self, embedding: List[float], value: Any):
+        """
+        Inserta una nueva entrada en la cache.
+        
+        Args:
+            embedding: Embedding de la pregunta.
+            value: Valor a cachear (por ejemplo, el dict con "answer" y "sources").
+        """
+        vector = self._normalize(embedding)
+        with self._lock:
+            if self._embeddings is None:
+                self._embeddings = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+            
+            size = len(self._values)
+            if size < self.max_entries:
+                index = size
+                self._values.append(value)
+            else:
+                # Reemplazar la entrada menos usada recientemente
+                index = int(np.argmin(self._last_used))
+                self._values[index] = value
+            
+            self._embeddings[index] = vector
+            self._clock += 1
+            self._last_used[index] = self._clock
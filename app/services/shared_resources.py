@@ -0,0 +1,63 @@
+"""
+Recursos compartidos por todo el proceso: pools de conexiones HTTP y event loop
+en segundo plano.
+
+Viven fuera de los caches de Streamlit: "Clear cache" recrea el pipeline RAG,
+pero reutiliza estos recursos en lugar de abrir otro loop y otros pools sin
+cerrar los anteriores.
+"""
+import asyncio
+import threading
+from typing import TYPE_CHECKING, Optional, Tuple
+
+if TYPE_CHECKING:
+    import httpx
+
+
+_lock = threading.Lock()
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_http_clients: Optional[Tuple["httpx.Client", "httpx.AsyncClient"]] = None
+
+
+def get_background_loop() -> asyncio.AbstractEventLoop:
+    """
+    Devuelve el event loop en segundo plano del proceso, creándolo la primera vez.
+    
+    Las llamadas asíncronas siempre se ejecutan en el mismo loop, así sus
+    conexiones HTTP/2 sobreviven a los reruns de Streamlit.
+    
+    Returns:
+        Event loop que se ejecuta en un hilo daemon.
+    """
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="azure-async-loop", daemon=True).start()
+        return _loop
+
+
+def get_http_clients() -> Tuple["httpx.Client", "httpx.AsyncClient"]:
+    """
+    Devuelve los clientes HTTP del proceso (síncrono y asíncrono, HTTP/2),
+    compartidos por Azure AI Search y Azure OpenAI.
+    
+    Returns:
+        Tupla (cliente síncrono, cliente asíncrono).
+    """
+    global _http_clients
+    with _lock:
+        if _http_clients is None:
+            import httpx
+            
+            _http_clients = (
+                httpx.Client(
+                    http2=True,
+                    limits=httpx.Limits(max_keepalive_connections=20)
+                ),
+                httpx.AsyncClient(
+                    http2=True,
+                    limits=httpx.Limits(max_keepalive_connections=20)
+                ),
+            )
+        return _http_clients
@@ -0,0 +1,51 @@
+"""
+Deduplicación de llamadas concurrentes idénticas ("single-flight").
+"""
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict
+
+
+class SingleFlight:
+    """
+    Ejecuta una sola vez el trabajo de una clave mientras está en curso: los
+    llamadores concurrentes con la misma clave esperan y reciben el mismo resultado.
+    """
+    
+    def __init__(self):
+        """Inicializa el mapa de llamadas en curso."""
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+    
+    def do(self, key: str, work: Callable[[], Any]) -> Any:
+        """
+        Ejecuta work() para la clave, o espera el resultado de la llamada en curso.
+        
+        Args:
+            key: Clave que identifica llamadas equivalentes.
+            work: Función sin argumentos que produce el resultado.
+        
+        Returns:
+            Resultado de work(); si work() lanza una excepción, se propaga a
+            todos los llamadores que esperaban esa clave.
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+        
+        if not owner:
+            return future.result()
+        
+        try:
+            result = work()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
@@ -0,0 +1,58 @@
+"""
+Pruebas del cargador de archivos .env.
+"""
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from app.services.fast_dotenv import fast_load
+
+
+class FastLoadTest(unittest.TestCase):
+    """Casos de formato que antes resolvía python-dotenv."""
+    
+    def _load(self, content: str) -> dict:
+        """Carga un .env temporal sobre un entorno vacío y devuelve el resultado."""
+        with tempfile.NamedTemporaryFile("w", suffix=".env", delete=False, encoding="utf-8") as env_file:
+            env_file.write(content)
+        self.addCleanup(os.unlink, env_file.name)
+        with mock.patch.dict(os.environ, {}, clear=True):
+            fast_load(env_file.name)
+            return dict(os.environ)
+    
+    def test_empty_value_does_not_consume_next_line(self):
+        env = self._load("A_EMPTY=\nB=2\n")
+        self.assertEqual(env, {"A_EMPTY": "", "B": "2"})
+    
+    def test_blank_lines_between_entries(self):
+        env = self._load("A=1\n\n   \nB=2\n")
+        self.assertEqual(env, {"A": "1", "B": "2"})
+    
+    def test_export_prefix(self):
+        env = self._load("export A=1\n  export   B = 2\n")
+        self.assertEqual(env, {"A": "1", "B": "2"})
+    
+    def test_inline_comment_unquoted(self):
+        env = self._load("A=value # comentario\nB=abc#def\n")
+        self.assertEqual(env, {"A": "value", "B": "abc#def"})
+    
+    def test_quoted_values(self):
+        env = self._load("A=\"con # almohadilla\" # comentario\nB='x y'\nC=\"\"\n")
+        self.assertEqual(env, {"A": "con # almohadilla", "B": "x y", "C": ""})
+    
+    def test_comment_lines_and_crlf(self):
+        env = self._load("# comentario\r\nA=1\r\n#B=2\r\n")
+        self.assertEqual(env, {"A": "1"})
+    
+    def test_existing_variables_are_not_overwritten(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".env", delete=False, encoding="utf-8") as env_file:
+            env_file.write("A=archivo\n")
+        self.addCleanup(os.unlink, env_file.name)
+        with mock.patch.dict(os.environ, {"A": "entorno"}, clear=True):
+            fast_load(env_file.name)
+            self.assertEqual(os.environ["A"], "entorno")
+
+
+if __name__ == "__main__":
+    unittest.main()
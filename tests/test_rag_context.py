@@ -0,0 +1,118 @@
+"""
+Pruebas de la selección de contexto y fuentes del pipeline RAG.
+"""
+import random
+import unittest
+from unittest import mock
+
+from app.services import rag_pipeline
+from app.services.azure_search_client import SearchHit
+from app.services.rag_pipeline import RAGPipeline
+
+
+def _hit(content: str, source: str = "doc.pdf", score: float = 1.0) -> SearchHit:
+    """Crea un resultado de búsqueda con los campos mínimos."""
+    return SearchHit(content=content, source=source, path=f"/docs/{source}", score=score)
+
+
+def _reference_build(search_results):
+    """Implementación directa (varias pasadas) del comportamiento esperado."""
+    unique = []
+    seen = set()
+    for doc in search_results:
+        if doc.content:
+            fingerprint = " ".join(doc.content.split())
+            if fingerprint in seen:
+                continue
+            seen.add(fingerprint)
+        unique.append(doc)
+    
+    sources = [{"source": d.source, "score": d.score, "path": d.path} for d in unique]
+    
+    half = rag_pipeline.MAX_CHARS_PER_CHUNK // 2
+    chunks = []
+    for doc in unique:
+        if not doc.content:
+            continue
+        content = doc.content
+        if len(content) > rag_pipeline.MAX_CHARS_PER_CHUNK:
+            content = content[:half] + "... [texto truncado] ..." + content[-half:]
+        chunks.append(content)
+    
+    selected = []
+    total = 0
+    for content in chunks:
+        total += len(content)
+        if total > rag_pipeline.MAX_TOTAL_CONTEXT:
+            if not selected:
+                selected.append(content[:rag_pipeline.MAX_TOTAL_CONTEXT] + "... [texto truncado]")
+            break
+        selected.append(content)
+    return selected, sources
+
+
+class BuildContextAndSourcesTest(unittest.TestCase):
+    """Deduplicación, truncado y límite total del contexto."""
+    
+    build = staticmethod(RAGPipeline._build_context_and_sources)
+    
+    def test_duplicates_ignore_whitespace(self):
+        chunks, sources = self.build([
+            _hit("Manual de  bomba\n centrífuga", "a.pdf"),
+            _hit("Manual de bomba centrífuga", "b.pdf"),
+        ])
+        self.assertEqual(chunks, ["Manual de  bomba\n centrífuga"])
+        self.assertEqual([s["source"] for s in sources], ["a.pdf"])
+    
+    def test_shared_header_is_not_a_duplicate(self):
+        header = "Encabezado común del manual " * 20
+        chunks, sources = self.build([
+            _hit(header + "página 1", "a.pdf"),
+            _hit(header + "página 2", "a.pdf"),
+        ])
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual(len(sources), 2)
+    
+    def test_long_chunk_is_truncated_in_the_middle(self):
+        half = rag_pipeline.MAX_CHARS_PER_CHUNK // 2
+        content = "a" * half + "b" * 1000 + "c" * half
+        chunks, _ = self.build([_hit(content)])
+        self.assertEqual(chunks, ["a" * half + "... [texto truncado] ..." + "c" * half])
+    
+    def test_total_limit_stops_context_but_keeps_sources(self):
+        size = rag_pipeline.MAX_CHARS_PER_CHUNK
+        hits = [_hit(str(i) * size, f"{i}.pdf") for i in range(5)]
+        chunks, sources = self.build(hits)
+        self.assertEqual(len(chunks), rag_pipeline.MAX_TOTAL_CONTEXT // size)
+        self.assertEqual(len(sources), 5)
+    
+    def test_overflowing_first_chunk_is_truncated(self):
+        with mock.patch.object(rag_pipeline, "MAX_TOTAL_CONTEXT", 10):
+            chunks, _ = self.build([_hit("x" * 50), _hit("y" * 5)])
+        self.assertEqual(chunks, ["x" * 10 + "... [texto truncado]"])
+    
+    def test_empty_content_is_listed_as_source(self):
+        chunks, sources = self.build([_hit("", "vacío.pdf"), _hit("texto", "b.pdf")])
+        self.assertEqual(chunks, ["texto"])
+        self.assertEqual([s["source"] for s in sources], ["vacío.pdf", "b.pdf"])
+    
+    def test_matches_reference_implementation(self):
+        rng = random.Random(1234)
+        words = ["bomba", "válvula", "presión", "  ", "\n", "motor"]
+        for _ in range(300):
+            hits = []
+            for i in range(rng.randint(0, 8)):
+                if hits and rng.random() < 0.3:
+                    # Repetir un resultado anterior (a veces con otros espacios)
+                    content = rng.choice(hits).content.replace(" ", "  ")
+                else:
+                    length = rng.choice([0, 5, 50, 300, 900])
+                    content = " ".join(rng.choice(words) for _ in range(length))
+                hits.append(_hit(content, f"{i}.pdf", rng.random()))
+            with mock.patch.object(rag_pipeline, "MAX_CHARS_PER_CHUNK", 400), \
+                    mock.patch.object(rag_pipeline, "MAX_TOTAL_CONTEXT", 1000):
+                self.assertEqual(self.build(hits), _reference_build(hits))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+"""
+Pruebas de la cache semántica de respuestas.
+"""
+import importlib.util
+import unittest
+
+from app.services.azure_search_client import SearchHit
+from app.services.rag_pipeline import RAGPipeline
+
+HAS_NUMPY = importlib.util.find_spec("numpy") is not None
+
+
+@unittest.skipUnless(HAS_NUMPY, "requiere numpy")
+class SemanticCacheTest(unittest.TestCase):
+    """Umbral de similitud y reemplazo LRU."""
+    
+    def setUp(self):
+        from app.services.semantic_cache import SemanticCache
+        self.cache_class = SemanticCache
+    
+    def test_empty_cache_misses(self):
+        cache = self.cache_class()
+        self.assertIsNone(cache.lookup([1.0, 0.0]))
+    
+    def test_hit_above_threshold_and_miss_below(self):
+        cache = self.cache_class(threshold=0.9)
+        cache.add([1.0, 0.0, 0.0], "a")
+        # Misma dirección con otra norma: similitud 1
+        self.assertEqual(cache.lookup([3.0, 0.0, 0.0]), "a")
+        # Similitud coseno ~0.995 (por encima del umbral)
+        self.assertEqual(cache.lookup([1.0, 0.1, 0.0]), "a")
+        # Similitud coseno ~0.707 (por debajo del umbral)
+        self.assertIsNone(cache.lookup([1.0, 1.0, 0.0]))
+    
+    def test_returns_most_similar_entry(self):
+        cache = self.cache_class(threshold=0.5)
+        cache.add([1.0, 0.0], "x")
+        cache.add([0.0, 1.0], "y")
+        self.assertEqual(cache.lookup([0.2, 1.0]), "y")
+        self.assertEqual(cache.lookup([1.0, 0.2]), "x")
+    
+    def test_full_cache_replaces_least_recently_used(self):
+        cache = self.cache_class(threshold=0.99, max_entries=2)
+        cache.add([1.0, 0.0, 0.0], "a")
+        cache.add([0.0, 1.0, 0.0], "b")
+        # Usar "a" para que "b" sea la menos usada recientemente
+        self.assertEqual(cache.lookup([1.0, 0.0, 0.0]), "a")
+        cache.add([0.0, 0.0, 1.0], "c")
+        
+        self.assertEqual(cache.lookup([1.0, 0.0, 0.0]), "a")
+        self.assertIsNone(cache.lookup([0.0, 1.0, 0.0]))
+        self.assertEqual(cache.lookup([0.0, 0.0, 1.0]), "c")
+    
+    def test_zero_vector_does_not_fail(self):
+        cache = self.cache_class()
+        cache.add([0.0, 0.0], "cero")
+        self.assertIsNone(cache.lookup([1.0, 0.0]))
+
+
+class _FixedCache:
+    """Cache de prueba que siempre devuelve el mismo valor."""
+    
+    def __init__(self, value):
+        self.value = value
+    
+    def lookup(self, embedding):
+        return self.value
+
+
+class PipelineCacheLookupTest(unittest.TestCase):
+    """Un acierto solo vale si sus fuentes siguen entre los resultados actuales."""
+    
+    def setUp(self):
+        self.cached = {
+            "answer": "respuesta",
+            "sources": [{"source": "a.pdf", "score": 1.0, "path": "/docs/a.pdf"}]
+        }
+        # Sin __init__: solo se necesita la cache semántica
+        self.pipeline = RAGPipeline.__new__(RAGPipeline)
+        self.pipeline._qcaches = {(5, 1.0): _FixedCache(self.cached)}
+    
+    @staticmethod
+    def _hits(*paths):
+        return [SearchHit(content="texto", source=p, path=p, score=1.0) for p in paths]
+    
+    def test_hit_when_sources_overlap(self):
+        result = self.pipeline._cache_lookup([1.0], 5, 1.0, self._hits("/docs/b.pdf", "/docs/a.pdf"))
+        self.assertEqual(result, self.cached)
+    
+    def test_miss_when_sources_differ(self):
+        self.assertIsNone(self.pipeline._cache_lookup([1.0], 5, 1.0, self._hits("/docs/b.pdf")))
+        self.assertIsNone(self.pipeline._cache_lookup([1.0], 5, 1.0, []))
+    
+    def test_hits_return_independent_copies(self):
+        hits = self._hits("/docs/a.pdf")
+        first = self.pipeline._cache_lookup([1.0], 5, 1.0, hits)
+        second = self.pipeline._cache_lookup([1.0], 5, 1.0, hits)
+        self.assertIsNot(first, second)
+        first["sources"][0]["score"] = 0.0
+        first["answer"] = "modificada"
+        self.assertEqual(second, self.cached)
+        self.assertEqual(self.cached["sources"][0]["score"], 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+"""
+Pruebas de la deduplicación de llamadas concurrentes (SingleFlight).
+"""
+import threading
+import unittest
+from concurrent.futures import Future
+from unittest import mock
+
+from app.services.rag_pipeline import RAGPipeline
+from app.services.single_flight import SingleFlight
+
+
+class SingleFlightTest(unittest.TestCase):
+    """Los llamadores concurrentes con la misma clave comparten una sola ejecución."""
+    
+    def _run_concurrently(self, flight: SingleFlight, key: str, work, callers: int = 5):
+        """Lanza varios llamadores mientras work() está bloqueado y devuelve sus resultados."""
+        results = [None] * callers
+        started = threading.Barrier(callers + 1)
+        
+        def call(index):
+            started.wait()
+            try:
+                results[index] = ("ok", flight.do(key, work))
+            except Exception as e:
+                results[index] = ("error", e)
+        
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(callers)]
+        for thread in threads:
+            thread.start()
+        started.wait()
+        return threads, results
+    
+    def _count_waiters(self) -> threading.Semaphore:
+        """
+        Envuelve Future.result durante la prueba para contar los llamadores que
+        esperan la llamada en curso: cada entrada libera una vez el semáforo devuelto.
+        """
+        waiting = threading.Semaphore(0)
+        original_result = Future.result
+        
+        def result(future, *args, **kwargs):
+            waiting.release()
+            return original_result(future, *args, **kwargs)
+        
+        patcher = mock.patch.object(Future, "result", result)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return waiting
+    
+    @staticmethod
+    def _wait_for(waiting: threading.Semaphore, count: int):
+        """Espera a que count llamadores hayan entrado a esperar el resultado."""
+        for _ in range(count):
+            if not waiting.acquire(timeout=5):
+                raise AssertionError("los llamadores no se unieron a la llamada en curso")
+    
+    def test_concurrent_callers_share_one_call(self):
+        flight = SingleFlight()
+        waiting = self._count_waiters()
+        calls = []
+        
+        def work():
+            calls.append(1)
+            # No terminar hasta que los otros cuatro llamadores esperen este resultado
+            self._wait_for(waiting, 4)
+            return 42
+        
+        threads, results = self._run_concurrently(flight, "k", work)
+        for thread in threads:
+            thread.join(timeout=5)
+        
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [("ok", 42)] * 5)
+        self.assertEqual(flight._inflight, {})
+    
+    def test_exception_propagates_to_waiters(self):
+        flight = SingleFlight()
+        waiting = self._count_waiters()
+        error = ValueError("fallo")
+        
+        def work():
+            self._wait_for(waiting, 4)
+            raise error
+        
+        threads, results = self._run_concurrently(flight, "k", work)
+        for thread in threads:
+            thread.join(timeout=5)
+        
+        self.assertEqual(results, [("error", error)] * 5)
+        self.assertEqual(flight._inflight, {})
+    
+    def test_sequential_calls_run_again(self):
+        flight = SingleFlight()
+        calls = []
+        
+        def work():
+            calls.append(1)
+            return len(calls)
+        
+        self.assertEqual(flight.do("k", work), 1)
+        self.assertEqual(flight.do("k", work), 2)
+    
+    def test_different_keys_do_not_share(self):
+        flight = SingleFlight()
+        self.assertEqual(flight.do("a", lambda: "a"), "a")
+        self.assertEqual(flight.do("b", lambda: "b"), "b")
+
+
+
+class RAGAnswerFlightTest(unittest.TestCase):
+    """rag_answer entrega a cada llamador su propia copia del resultado compartido."""
+    
+    def test_callers_get_independent_copies(self):
+        shared = {"answer": "respuesta", "sources": [{"source": "a.pdf", "score": 1.0, "path": "/a"}]}
+        # Sin __init__: simular que todos los llamadores reciben el mismo resultado en curso
+        pipeline = RAGPipeline.__new__(RAGPipeline)
+        pipeline._answer_flight = mock.Mock(do=mock.Mock(return_value=shared))
+        
+        first = pipeline.rag_answer("pregunta")
+        second = pipeline.rag_answer("pregunta")
+        first["sources"][0]["score"] = 0.0
+        
+        self.assertIsNot(first, shared)
+        self.assertEqual(second, shared)
+        self.assertEqual(shared["sources"][0]["score"], 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
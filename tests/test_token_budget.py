@@ -0,0 +1,70 @@
+"""
+Pruebas del presupuesto de tokens del contexto.
+"""
+import unittest
+from unittest import mock
+
+from app.services import azure_openai_client
+from app.services.azure_openai_client import _apply_token_budget
+
+
+class _CharEncoding:
+    """Tokenizer de prueba: un token por carácter."""
+    
+    @staticmethod
+    def encode(text):
+        return [ord(c) for c in text]
+    
+    @staticmethod
+    def decode(tokens):
+        return "".join(chr(t) for t in tokens)
+
+
+class _FailingEncoding:
+    """Tokenizer de prueba que falla al tokenizar."""
+    
+    @staticmethod
+    def encode(text):
+        raise RuntimeError("fallo de tokenización")
+
+
+class ApplyTokenBudgetTest(unittest.TestCase):
+    """Recorte por tokens y degradación cuando no hay tokenizer."""
+    
+    def setUp(self):
+        azure_openai_client._encode.cache_clear()
+        self.addCleanup(azure_openai_client._encode.cache_clear)
+    
+    def _with_encoding(self, encoding):
+        patcher = mock.patch.object(azure_openai_client, "_get_encoding", return_value=encoding)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_chunks_within_budget_are_kept(self):
+        self._with_encoding(_CharEncoding())
+        self.assertEqual(_apply_token_budget(["abc", "de"], budget=5), ["abc", "de"])
+    
+    def test_overflowing_chunk_is_trimmed_and_rest_dropped(self):
+        self._with_encoding(_CharEncoding())
+        self.assertEqual(
+            _apply_token_budget(["abc", "defgh", "ij"], budget=5),
+            ["abc", "de... [texto truncado]"]
+        )
+    
+    def test_no_remaining_budget_adds_nothing(self):
+        self._with_encoding(_CharEncoding())
+        self.assertEqual(_apply_token_budget(["abc", "de"], budget=3), ["abc"])
+    
+    def test_without_tokenizer_chunks_are_unchanged(self):
+        self._with_encoding(None)
+        chunks = ["a" * 100, "b" * 100]
+        self.assertEqual(_apply_token_budget(chunks, budget=1), chunks)
+    
+    def test_tokenizer_failure_returns_chunks_unchanged(self):
+        self._with_encoding(_FailingEncoding())
+        chunks = ["abc", "def"]
+        self.assertEqual(_apply_token_budget(chunks, budget=1), chunks)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+"""
+Validación estática de la configuración (se ejecuta como hook de pre-commit).
+
+Comprueba que los dataclasses de app/config.py tengan los campos esperados y que
+.env.example documente todas las variables de entorno que lee app/config.py
+(recogidas de sus llamadas a get_env_var/os.getenv), para que esos errores se
+detecten antes del commit y no al arrancar la aplicación.
+
+Uso:
+    python tools/validate_config.py
+"""
+import ast
+import re
+import sys
+from dataclasses import fields, is_dataclass
+from pathlib import Path
+
+# Agregar el directorio raíz del proyecto al PYTHONPATH
+project_root = Path(__file__).parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from app import config
+
+CONFIG_PATH = project_root / "app" / "config.py"
+
+# Campos esperados de cada dataclass de configuración
+EXPECTED_FIELDS = {
+    "AzureSearchConfig": ("endpoint", "api_key", "index_name"),
+    "AzureOpenAIConfig": ("endpoint", "api_key", "deployment_name", "embedding_deployment"),
+    "AzureSpeechConfig": ("api_key", "region", "language", "voice_name", "tts_cache_dir"),
+    "AppConfig": ("azure_search", "azure_openai", "azure_speech", "streamlit_port"),
+}
+
+_ENV_KEY_RE = re.compile(r"^[ \t]*([A-Za-z_][A-Za-z0-9_]*)[ \t]*=", re.M)
+# Las variables opcionales pueden documentarse comentadas ("# CLAVE=...")
+_COMMENTED_ENV_KEY_RE = re.compile(r"^[ \t]*#[ \t]*([A-Za-z_][A-Za-z0-9_]*)[ \t]*=", re.M)
+
+
+def check_dataclasses() -> list:
+    """Devuelve la lista de errores encontrados en los dataclasses de configuración."""
+    errors = []
+    for class_name, expected in EXPECTED_FIELDS.items():
+        cls = getattr(config, class_name, None)
+        if cls is None or not is_dataclass(cls):
+            errors.append(f"{class_name} no existe o no es un dataclass")
+            continue
+        
+        actual = tuple(f.name for f in fields(cls))
+        if actual != expected:
+            errors.append(f"{class_name}: campos {actual}, se esperaban {expected}")
+    return errors
+
+
+def _is_false(node: ast.AST) -> bool:
+    """Indica si el nodo es el literal False."""
+    return isinstance(node, ast.Constant) and node.value is False
+
+
+def collect_env_vars() -> tuple:
+    """
+    Recoge las variables de entorno que lee app/config.py analizando su código.
+    
+    Returns:
+        Tupla (variables requeridas, variables opcionales). Son requeridas las leídas
+        con get_env_var sin required=False; las de os.getenv/os.environ.get son opcionales.
+    """
+    tree = ast.parse(CONFIG_PATH.read_text(encoding="utf-8"))
+    required, optional = set(), set()
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Call) or not node.args:
+            continue
+        name_arg = node.args[0]
+        if not (isinstance(name_arg, ast.Constant) and isinstance(name_arg.value, str)):
+            continue
+        
+        func = node.func
+        if isinstance(func, ast.Name) and func.id == "get_env_var":
+            is_optional = (
+                (len(node.args) > 1 and _is_false(node.args[1]))
+                or any(kw.arg == "required" and _is_false(kw.value) for kw in node.keywords)
+            )
+            (optional if is_optional else required).add(name_arg.value)
+        elif isinstance(func, ast.Attribute) and (
+            (func.attr == "getenv" and isinstance(func.value, ast.Name) and func.value.id == "os")
+            or (func.attr == "get" and isinstance(func.value, ast.Attribute) and func.value.attr == "environ")
+        ):
+            optional.add(name_arg.value)
+    return required, optional - required
+
+
+def check_env_example() -> list:
+    """Devuelve la lista de variables que faltan en .env.example."""
+    env_example = project_root / ".env.example"
+    if not env_example.exists():
+        return [".env.example no encontrado"]
+    
+    required, optional = collect_env_vars()
+    if not required:
+        return ["No se encontraron llamadas a get_env_var en app/config.py"]
+    
+    text = env_example.read_text(encoding="utf-8-sig")
+    documented = set(_ENV_KEY_RE.findall(text))
+    documented_optional = documented | set(_COMMENTED_ENV_KEY_RE.findall(text))
+    return [
+        f"Variable '{name}' no documentada en .env.example"
+        for name in sorted(required)
+        if name not in documented
+    ] + [
+        f"Variable '{name}' no documentada en .env.example"
+        for name in sorted(optional)
+        if name not in documented_optional
+    ]
+
+
+def main() -> int:
+    errors = check_dataclasses() + check_env_example()
+    for error in errors:
+        print(f"❌ {error}")
+    if not errors:
+        print("✅ Configuración válida")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())